@@ -0,0 +1,285 @@
+import os
+import math
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Generation runs allowed to call the APIs at the same time (per server process).
+MAX_CONCURRENT_RUNS = int(os.getenv("INBOXFM_MAX_CONCURRENT_RUNS", "4"))
+# Longest a request may wait in the queue. Requests whose projected wait is longer are
+# turned away immediately instead of piling up behind the rate limits.
+MAX_QUEUE_WAIT_SECONDS = float(os.getenv("INBOXFM_MAX_QUEUE_WAIT_SECONDS", "300"))
+# Starting guess for how long one run holds its slot; refined from finished runs.
+INITIAL_RUN_SECONDS = float(os.getenv("INBOXFM_EXPECTED_RUN_SECONDS", "60"))
+RUN_SECONDS_SMOOTHING = 0.2
+
+# Per-user budgets over a rolling window (0 disables a budget).
+USER_TOKEN_BUDGET = int(os.getenv("INBOXFM_USER_TOKEN_BUDGET", "200000"))
+USER_TTS_CHAR_BUDGET = int(os.getenv("INBOXFM_USER_TTS_CHAR_BUDGET", "60000"))
+QUOTA_WINDOW_SECONDS = int(os.getenv("INBOXFM_QUOTA_WINDOW_SECONDS", "3600"))
+
+# Request header identifying the user behind a trusted proxy (e.g. X-Forwarded-User).
+# Without it, the queue holds one ticket per browser session, and quotas are charged
+# per client IP address: a reload starts a new session, so sessions cannot carry a
+# budget. Users behind the same NAT or proxy then share one budget (all of them, when
+# the app itself runs behind a reverse proxy), so set the header for per-user quotas.
+USER_HEADER = os.getenv("INBOXFM_USER_HEADER")
+
+
+class AdmissionError(RuntimeError):
+    """Base class for requests that are not admitted; the message is shown to the user."""
+
+
+class QueueFullError(AdmissionError):
+    """Raised when the queue wait would exceed MAX_QUEUE_WAIT_SECONDS (load shedding)."""
+
+
+class QuotaExceededError(AdmissionError):
+    """Raised when a run would exceed the user's token or TTS character budget."""
+
+
+def _header_user(headers):
+    if USER_HEADER and headers:
+        value = headers.get(USER_HEADER)
+        if value:
+            return value.split(',')[0].strip()
+    return None
+
+def user_key_for(headers=None, session_id=None):
+    """
+    Identifies who a request is queued for (one ticket per key).
+
+    Args:
+        headers (mapping, optional): Request headers (e.g. st.context.headers).
+            Only used when INBOXFM_USER_HEADER is configured.
+        session_id (str, optional): Browser session ID, used otherwise.
+
+    Returns:
+        str: A key such as "user:alice" or "session:<id>".
+    """
+    user = _header_user(headers)
+    if user:
+        return f"user:{user}"
+    return f"session:{session_id or uuid.uuid4()}"
+
+def quota_key_for(headers=None, ip_address=None):
+    """
+    Identifies the user a request's cost is charged to (see UserQuotas).
+
+    Unlike user_key_for this never falls back to the browser session, which a
+    page reload would replace along with its budget.
+
+    Args:
+        headers (mapping, optional): Request headers (e.g. st.context.headers).
+            Only used when INBOXFM_USER_HEADER is configured.
+        ip_address (str, optional): Client IP address (e.g. st.context.ip_address),
+            used otherwise. None for local connections, which share one budget.
+
+    Returns:
+        str: A key such as "user:alice", "ip:203.0.113.7" or "ip:local".
+    """
+    user = _header_user(headers)
+    if user:
+        return f"user:{user}"
+    return f"ip:{ip_address or 'local'}"
+
+
+class Ticket:
+    """A place in the admission queue (and, once admitted, a run slot)."""
+    def __init__(self, user_key):
+        self.id = uuid.uuid4().hex
+        self.user_key = user_key
+        self.enqueued_at = time.monotonic()
+        self.admitted_at = None
+
+    @property
+    def admitted(self):
+        return self.admitted_at is not None
+
+
+class AdmissionController:
+    """
+    Global concurrency cap with a fair FIFO waiting queue and load shedding.
+
+    At most `max_concurrent` runs hold a slot; everyone else waits in arrival
+    order, one ticket per user, so a single user cannot crowd out the queue.
+    A request is rejected up front when its projected wait (queue position
+    times the recent average run time, divided over the slots) is longer than
+    `max_queue_wait`, and a waiting request gives up once it has actually
+    waited that long, which keeps tail latency bounded during bursts.
+
+    Usage:
+        ticket = admission_controller.submit(user_key)
+        try:
+            while not admission_controller.wait(ticket, timeout=1):
+                show(admission_controller.position(ticket))
+            ... run the pipeline ...
+        finally:
+            admission_controller.release(ticket)
+    """
+    def __init__(self, max_concurrent=MAX_CONCURRENT_RUNS, max_queue_wait=MAX_QUEUE_WAIT_SECONDS, initial_run_seconds=INITIAL_RUN_SECONDS):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue_wait = max_queue_wait
+        self.avg_run_seconds = initial_run_seconds
+        self._queue = deque()
+        self._active = {}
+        self._condition = threading.Condition()
+
+    def _user_has_ticket(self, user_key):
+        return any(t.user_key == user_key for t in self._queue) or any(t.user_key == user_key for t in self._active.values())
+
+    def _promote(self):
+        # Caller holds the condition
+        while self._queue and len(self._active) < self.max_concurrent:
+            ticket = self._queue.popleft()
+            ticket.admitted_at = time.monotonic()
+            self._active[ticket.id] = ticket
+            logging.info(f"Admitted run for {ticket.user_key} after {ticket.admitted_at - ticket.enqueued_at:.1f}s in queue ({len(self._active)}/{self.max_concurrent} active).")
+        self._condition.notify_all()
+
+    def estimated_wait(self, position):
+        """Projected seconds until the ticket at 1-based queue `position` gets a slot."""
+        if position <= 0:
+            return 0.0
+        return math.ceil(position / self.max_concurrent) * self.avg_run_seconds
+
+    def submit(self, user_key):
+        """
+        Joins the queue (and takes a slot right away when one is free).
+
+        Raises:
+            AdmissionError: If the user already has a run queued or in progress.
+            QueueFullError: If the projected wait exceeds the limit.
+        """
+        with self._condition:
+            if self._user_has_ticket(user_key):
+                raise AdmissionError("You already have a podcast being generated. Please wait for it to finish.")
+            position = len(self._queue) + 1
+            if len(self._active) >= self.max_concurrent and self.estimated_wait(position) > self.max_queue_wait:
+                logging.warning(f"Shedding request from {user_key}: {len(self._queue)} queued, projected wait {self.estimated_wait(position):.0f}s.")
+                raise QueueFullError(
+                    f"Inbox.fm is very busy right now ({len(self._queue)} requests waiting). "
+                    f"Please try again in about {max(1, round(self.estimated_wait(position) / 60))} min."
+                )
+            ticket = Ticket(user_key)
+            self._queue.append(ticket)
+            self._promote()
+            return ticket
+
+    def position(self, ticket):
+        """1-based place in the queue, or 0 once the ticket holds a slot."""
+        with self._condition:
+            if ticket.admitted:
+                return 0
+            for index, queued in enumerate(self._queue):
+                if queued.id == ticket.id:
+                    return index + 1
+            return 0
+
+    def wait(self, ticket, timeout=None):
+        """
+        Waits up to `timeout` seconds for the ticket to be admitted.
+
+        Returns:
+            bool: True once the ticket holds a slot.
+
+        Raises:
+            QueueFullError: If the ticket has waited longer than the limit; it
+                leaves the queue.
+        """
+        with self._condition:
+            if not ticket.admitted:
+                self._condition.wait(timeout)
+            if ticket.admitted:
+                return True
+            if time.monotonic() - ticket.enqueued_at > self.max_queue_wait:
+                self._queue = deque(t for t in self._queue if t.id != ticket.id)
+                raise QueueFullError("Your request waited too long in the queue because Inbox.fm is very busy. Please try again in a few minutes.")
+            return False
+
+    def release(self, ticket):
+        """Frees the ticket's slot (or its queue place) and admits the next request."""
+        with self._condition:
+            if self._active.pop(ticket.id, None) is not None:
+                run_seconds = time.monotonic() - ticket.admitted_at
+                self.avg_run_seconds += RUN_SECONDS_SMOOTHING * (run_seconds - self.avg_run_seconds)
+            else:
+                self._queue = deque(t for t in self._queue if t.id != ticket.id)
+            self._promote()
+
+    def stats(self):
+        """Current load: active runs, queued requests and the average run time."""
+        with self._condition:
+            return {"active": len(self._active), "queued": len(self._queue), "avg_run_seconds": self.avg_run_seconds}
+
+
+class UserQuotas:
+    """
+    Per-user token and TTS character budgets over a rolling window, keyed by
+    quota_key_for.
+
+    Runs are charged their estimated cost before any API call is made (see
+    utils.estimate_run_cost), so a request that would overrun a budget is
+    refused before it spends anything.
+    """
+    def __init__(self, token_budget=USER_TOKEN_BUDGET, char_budget=USER_TTS_CHAR_BUDGET, window_seconds=QUOTA_WINDOW_SECONDS):
+        self.token_budget = token_budget
+        self.char_budget = char_budget
+        self.window_seconds = window_seconds
+        self._usage = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, user_key, now):
+        # Caller holds the lock
+        entries = self._usage.get(user_key)
+        while entries and now - entries[0][0] > self.window_seconds:
+            entries.popleft()
+        if not entries:
+            self._usage.pop(user_key, None)
+            return deque()
+        return entries
+
+    def used(self, user_key):
+        """(tokens, characters) charged to the user within the current window."""
+        with self._lock:
+            entries = self._prune(user_key, time.time())
+            return sum(e[1] for e in entries), sum(e[2] for e in entries)
+
+    def reserve(self, user_key, tokens, chars):
+        """
+        Charges an estimated run cost to the user.
+
+        Raises:
+            QuotaExceededError: If either budget would be exceeded; nothing is charged.
+        """
+        with self._lock:
+            now = time.time()
+            entries = self._prune(user_key, now)
+            used_tokens = sum(e[1] for e in entries)
+            used_chars = sum(e[2] for e in entries)
+            over_tokens = self.token_budget and used_tokens + tokens > self.token_budget
+            over_chars = self.char_budget and used_chars + chars > self.char_budget
+            if over_tokens or over_chars:
+                logging.warning(f"Quota exceeded for {user_key}: tokens {used_tokens}+{tokens}/{self.token_budget}, chars {used_chars}+{chars}/{self.char_budget}.")
+                what = "text generation" if over_tokens else "audio"
+                if (self.token_budget and tokens > self.token_budget) or (self.char_budget and chars > self.char_budget):
+                    detail = "a single request this large is over the limit"
+                else:
+                    resets_in = self.window_seconds - (now - entries[0][0])
+                    detail = f"it frees up again in about {max(1, round(resets_in / 60))} min"
+                raise QuotaExceededError(
+                    f"This request would exceed your {what} allowance ({detail}). "
+                    "Try fewer or shorter newsletters, or a shorter podcast length."
+                )
+            entries.append((now, tokens, chars))
+            self._usage[user_key] = entries
+
+
+# Shared by every session served by this process
+admission_controller = AdmissionController()
+user_quotas = UserQuotas()
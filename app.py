@@ -1,15 +1,22 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import os
 import tempfile
 import uuid
 import logging
 from pathlib import Path
-import base64 # Import base64 library
 
 # Import functions from our utility script
 # Ensure utils.py and genai.py are in the same directory
 try:
-    from utils import read_uploaded_files, generate_podcast_script, generate_podcast_audio
+    from pipeline import PipelineRun, NoContentError, compute_run_id, touch_run, sweep_idle_runs, LIVE_DIR, LIVE_URL_PATH
+    from utils import estimate_run_cost, publish_live_segment
+    from segments import SegmentPlaylist, PLAYLIST_FILENAME
+    from admission import admission_controller, user_quotas, user_key_for, quota_key_for, AdmissionError
+    from artifact_store import artifact_store
+    from profiling import RunProfiler, profiling_enabled
+    from providers import provider_requires_api_key
+    from audio_formats import AUDIO_PROFILES, DEFAULT_AUDIO_PROFILE, mime_type_for_path
 except ImportError:
     st.error("Failed to import required modules. Make sure 'utils.py' and 'genai.py' are in the correct directory.")
     st.stop() # Stop execution if imports fail
@@ -20,6 +27,8 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # --- Constants ---
 # Directory to store generated audio files, relative to the app script
 AUDIO_DIR = "audio_output"
+# Plays the live HLS playlist in browsers without native HLS support (all but Safari)
+HLS_JS_URL = "https://cdn.jsdelivr.net/npm/hls.js@1.5.20/dist/hls.min.js"
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -76,17 +85,13 @@ st.markdown("""
     }
     /* Center elements like audio player and download button */
     /* Target the custom HTML audio player */
-    .audio-container, div[data-testid="stDownloadButton"] {
+    div[data-testid="stDownloadButton"] {
        display: flex;
        justify-content: center;
        margin-top: 1rem;
        flex-direction: column; /* Stack player and download */
        align-items: center;
     }
-    .audio-container audio {
-        width: 80%; /* Adjust width as needed */
-        margin-bottom: 1rem; /* Space between player and download button */
-    }
     div[data-testid="stDownloadButton"] button {
        background-color: #48BB78; /* Green background */
        width: auto; /* Adjust width automatically */
@@ -111,15 +116,22 @@ if 'session_id' not in st.session_state:
         os.makedirs(AUDIO_DIR)
         logging.info(f"Created audio output directory: {AUDIO_DIR}")
 
-if 'combined_text' not in st.session_state:
-    st.session_state.combined_text = None
-if 'podcast_script' not in st.session_state:
-    st.session_state.podcast_script = None
+# Large text payloads live in the shared artifact store; session state only keeps their handles
+if 'combined_text_handle' not in st.session_state:
+    st.session_state.combined_text_handle = None
+if 'podcast_script_handle' not in st.session_state:
+    st.session_state.podcast_script_handle = None
 # Store the relative path for web access and the full path for file operations
 if 'audio_relative_path' not in st.session_state:
      st.session_state.audio_relative_path = None # Keep for potential future use? Or remove? Let's keep for now.
 if 'audio_full_path' not in st.session_state:
     st.session_state.audio_full_path = None
+# Full paths of extra renditions (other audio profiles) produced alongside the main file
+if 'audio_rendition_paths' not in st.session_state:
+    st.session_state.audio_rendition_paths = []
+# Number of segments already played back live during progressive generation
+if 'live_segment_count' not in st.session_state:
+    st.session_state.live_segment_count = 0
 if 'is_processing' not in st.session_state:
     st.session_state.is_processing = False
 if 'error_message' not in st.session_state:
@@ -128,30 +140,90 @@ if 'read_files_list' not in st.session_state:
     st.session_state.read_files_list = []
 if 'failed_files_list' not in st.session_state:
     st.session_state.failed_files_list = []
+# ID of the current (possibly resumable) pipeline run
+if 'run_id' not in st.session_state:
+    st.session_state.run_id = None
+# Flame graph of the last run, when profiling was switched on
+if 'profile_svg_path' not in st.session_state:
+    st.session_state.profile_svg_path = None
+
+# Keep this session alive in the artifact store and drop artifacts of sessions that went idle
+artifact_store.touch(st.session_state.session_id)
+artifact_store.evict_idle_sessions()
+# Run checkpoints follow the same idle rule; keep this session's current run alive
+if st.session_state.get('run_id'):
+    touch_run(st.session_state.run_id)
+sweep_idle_runs()
 
 # --- Helper Function ---
 def reset_state():
     """Resets the session state for a new podcast generation."""
-    st.session_state.combined_text = None
-    st.session_state.podcast_script = None
+    artifact_store.delete(st.session_state.combined_text_handle)
+    artifact_store.delete(st.session_state.podcast_script_handle)
+    st.session_state.combined_text_handle = None
+    st.session_state.podcast_script_handle = None
     st.session_state.audio_relative_path = None
     st.session_state.audio_full_path = None
+    st.session_state.audio_rendition_paths = []
+    st.session_state.live_segment_count = 0
     st.session_state.is_processing = False
     st.session_state.error_message = None
     st.session_state.read_files_list = []
     st.session_state.failed_files_list = []
+    st.session_state.profile_svg_path = None
+    st.session_state.run_id = None
     # Note: We are not cleaning up the AUDIO_DIR here for simplicity,
     # but in a production app, you'd want a cleanup strategy.
     logging.info("Session state reset.")
 
+def render_live_player(playlist_url):
+    """
+    Renders one audio player that follows a growing HLS playlist, so playback
+    moves on from segment to segment by itself while later ones are synthesized.
+    """
+    components.html(f"""
+        <audio id="live-player" controls autoplay style="width: 100%;"></audio>
+        <script src="{HLS_JS_URL}"></script>
+        <script>
+            const audio = document.getElementById("live-player");
+            const source = new URL("{playlist_url}", document.baseURI).href;
+            if (window.Hls && Hls.isSupported()) {{
+                // Start at the first segment, not at the live edge of the growing playlist
+                const hls = new Hls({{ startPosition: 0 }});
+                hls.loadSource(source);
+                hls.attachMedia(audio);
+            }} else if (audio.canPlayType("application/vnd.apple.mpegurl")) {{
+                audio.src = source;
+            }}
+            // Browsers may block autoplay until the listener presses play once
+            audio.play().catch(() => {{}});
+        </script>
+    """, height=60)
+
+def current_user_key():
+    """The key this session's runs are queued under (see admission.user_key_for)."""
+    try:
+        headers = st.context.headers
+    except Exception:
+        headers = None
+    return user_key_for(headers, st.session_state.session_id)
+
+def current_quota_key():
+    """The key this session's usage is charged to (see admission.quota_key_for)."""
+    try:
+        headers, ip_address = st.context.headers, st.context.ip_address
+    except Exception:
+        headers, ip_address = None, None
+    return quota_key_for(headers, ip_address)
+
 # --- Main Application UI ---
 
 # Header
 st.markdown('<div class="main-header">🎙️ Inbox.fm</div>', unsafe_allow_html=True)
 st.markdown('<div class="info-text">Transform your newsletters into personalized podcasts.</div>', unsafe_allow_html=True)
 
-# Check for API Key early
-if not os.getenv("OPENAI_API_KEY"):
+# Check for API Key early (the offline "local" provider does not need one)
+if provider_requires_api_key() and not os.getenv("OPENAI_API_KEY"):
     st.error("🚨 OpenAI API Key not found. Please set the OPENAI_API_KEY environment variable (e.g., in a .env file) and restart the app.")
     st.stop()
 
@@ -199,6 +271,34 @@ with col1:
             key="podcast_voice"
         )
 
+    # Audio Format Selection
+    format_col1, format_col2 = st.columns(2)
+
+    with format_col1:
+        audio_profile_option = st.selectbox(
+            "Audio Format:",
+            options=list(AUDIO_PROFILES),
+            index=list(AUDIO_PROFILES).index(DEFAULT_AUDIO_PROFILE),
+            format_func=lambda name: AUDIO_PROFILES[name].label,
+            key="podcast_audio_profile"
+        )
+
+    with format_col2:
+        # Extra renditions are transcoded locally from the same synthesis (requires ffmpeg)
+        rendition_options = st.multiselect(
+            "Also Prepare Downloads In:",
+            options=[name for name in AUDIO_PROFILES if name != audio_profile_option],
+            format_func=lambda name: AUDIO_PROFILES[name].label,
+            key="podcast_renditions"
+        )
+
+    # Segmented synthesis lets playback start while the rest of the episode is generated
+    progressive_playback = st.checkbox(
+        "Start playing while the episode is still being generated",
+        value=True,
+        key="podcast_progressive"
+    )
+
     # Generate Button
     st.markdown("---") # Visual separator
     generate_button = st.button("✨ Generate Podcast", key="generate_button", use_container_width=True)
@@ -210,46 +310,105 @@ if generate_button and uploaded_files:
     st.session_state.is_processing = True
     st.session_state.error_message = None
 
+    # The run ID is derived from the uploads and options, so retrying a request that failed
+    # resumes its checkpointed run (see pipeline.py) instead of starting over. A completed
+    # run is not reused: generating again starts a new run with a fresh script.
+    run_options = {
+        "instructions": instructions,
+        "length_option": length_option,
+        "voice": voice_option,
+        "speed": 1.0,
+        "audio_profile": audio_profile_option,
+        "renditions": sorted(rendition_options),
+    }
+    run_id = compute_run_id(st.session_state.session_id, uploaded_files, run_options)
+    st.session_state.run_id = run_id
+    pipeline_run = PipelineRun(run_id, run_options)
+
+    # Profiling is off unless INBOXFM_PROFILE is set or the admin opened the app with ?profile=<token>
+    episode_stem = f"inboxfm_podcast_{run_id}"
+    run_profiler = RunProfiler(AUDIO_DIR, episode_stem) if profiling_enabled(st.query_params) else None
+
+    user_key = current_user_key()
+    quota_key = current_quota_key()
+    admission_ticket = None
+    live_playlist = None
+
     # Display spinner context manager
     with st.spinner("Processing... Reading files, generating script, and creating audio..."):
         try:
-            # 1. Read Files (using OS temp dir for reading)
-            logging.info("Starting file reading process.")
-            combined_text, read_files, failed_files = read_uploaded_files(uploaded_files, st.session_state.temp_dir_read)
-            st.session_state.combined_text = combined_text
-            st.session_state.read_files_list = read_files
-            st.session_state.failed_files_list = failed_files
-            logging.info(f"Files read. Success: {len(read_files)}, Failed: {len(failed_files)}")
-
-            # Check if any content was actually read
-            if not combined_text:
-                st.session_state.error_message = "Could not read any content from the uploaded files. Please check the file formats and content."
-            else:
-                # 2. Generate Script (only if text was read)
-                logging.info("Generating podcast script.")
-                script = generate_podcast_script(combined_text, instructions, length_option)
-                st.session_state.podcast_script = script
-                logging.info("Podcast script generated.")
-
-                # 3. Generate Audio (saving to AUDIO_DIR)
-                logging.info(f"Generating podcast audio in directory: {AUDIO_DIR}")
-                # Define filename using session ID to avoid conflicts
-                audio_filename = f"inboxfm_podcast_{st.session_state.session_id}.mp3"
-                # Pass AUDIO_DIR as the output directory
-                # generate_podcast_audio should return the full path to the saved file
-                generated_audio_full_path = generate_podcast_audio(
-                    script_text=script,
-                    output_dir=AUDIO_DIR, # Pass the dedicated audio directory
-                    voice_name=voice_option,
-                    speed=1.0,
-                    filename=audio_filename
+            # Wait for a run slot; the queue is shared by all sessions and served in arrival order
+            admission_ticket = admission_controller.submit(user_key)
+            queue_status = col2.empty()
+            while not admission_controller.wait(admission_ticket, timeout=1):
+                position = admission_controller.position(admission_ticket)
+                eta = admission_controller.estimated_wait(position)
+                queue_status.info(f"⏳ Inbox.fm is busy right now. You are #{position} in line (about {max(1, round(eta / 60))} min).")
+            queue_status.empty()
+
+            if run_profiler:
+                run_profiler.start()
+
+            resume_from = pipeline_run.first_incomplete_stage()
+            if resume_from not in (None, "extract"):
+                st.info(f"♻️ Resuming your previous attempt from the '{resume_from}' step.")
+
+            # In progressive mode, finished segments are appended to a live HLS playlist and one
+            # player follows it. The player stays in place when the episode is ready, since the
+            # listener may still be playing it; the full episode player is rendered below it.
+            if progressive_playback:
+                live_playlist = SegmentPlaylist(os.path.join(LIVE_DIR, run_id))
+            live_player = col2.container()
+            live_progress = col2.empty()
+
+            def show_live_segment(index, segment_path, total):
+                try:
+                    publish_live_segment(live_playlist, segment_path)
+                except Exception as e:
+                    # Live playback is a convenience; the episode itself is still assembled
+                    logging.error(f"Could not publish segment {index + 1} for live playback: {e}")
+                if index == 0:
+                    live_player.markdown('<div class="sub-header">Now Playing (still generating...)</div>', unsafe_allow_html=True)
+                    with live_player:
+                        render_live_player(f"{LIVE_URL_PATH}/{run_id}/{PLAYLIST_FILENAME}")
+                live_progress.caption(f"{index + 1} of {total} parts ready")
+                st.session_state.live_segment_count = index + 1
+
+            def log_stage(stage, resumed):
+                logging.info(f"Run {run_id}: {'reusing' if resumed else 'starting'} stage '{stage}'.")
+
+            # 1. Read Files -> 2. Generate Script -> 3. Synthesize Segments -> 4. Assemble Audio (into AUDIO_DIR)
+            try:
+                run_result = pipeline_run.execute(
+                    uploaded_files,
+                    st.session_state.temp_dir_read, # OS temp dir for reading
+                    AUDIO_DIR, # Pass the dedicated audio directory
+                    on_stage=log_stage,
+                    on_segment=show_live_segment if progressive_playback else None,
+                    # Charge the estimated cost to the user's quota before any API call
+                    before_generation=lambda text, stage: user_quotas.reserve(quota_key, *estimate_run_cost(text, length_option, stage))
                 )
+            except NoContentError as e:
+                extract_stage = pipeline_run.stage("extract")
+                st.session_state.read_files_list = extract_stage.get("read_files", [])
+                st.session_state.failed_files_list = extract_stage.get("failed_files", [])
+                st.session_state.error_message = str(e)
+                run_result = None
+
+            if run_result:
+                st.session_state.combined_text_handle = artifact_store.put_text(st.session_state.session_id, run_result["combined_text"])
+                st.session_state.read_files_list = run_result["read_files"]
+                st.session_state.failed_files_list = run_result["failed_files"]
+                st.session_state.podcast_script_handle = artifact_store.put_text(st.session_state.session_id, run_result["script"])
+                generated_audio_full_path = run_result["audio_path"]
 
                 # Check if the audio file was actually created and has size > 0
                 if os.path.exists(generated_audio_full_path) and os.path.getsize(generated_audio_full_path) > 0:
                     st.session_state.audio_full_path = generated_audio_full_path
                     # Store the relative path just in case, but we won't use it for the player now
-                    st.session_state.audio_relative_path = os.path.join(AUDIO_DIR, audio_filename)
+                    st.session_state.audio_relative_path = os.path.join(AUDIO_DIR, Path(generated_audio_full_path).name)
+                    # Renditions are optional; only the ones that were actually produced are returned
+                    st.session_state.audio_rendition_paths = run_result["rendition_paths"]
                     logging.info(f"Podcast audio generated successfully at {st.session_state.audio_full_path}, size: {os.path.getsize(st.session_state.audio_full_path)} bytes")
                 elif os.path.exists(generated_audio_full_path):
                     st.session_state.error_message = "Audio generation finished, but the audio file is empty (0 bytes)."
@@ -258,17 +417,36 @@ if generate_button and uploaded_files:
                     st.session_state.error_message = "Audio generation finished, but the audio file was not found."
                     logging.error(f"Audio file path not found after generation attempt: {generated_audio_full_path}")
 
+        except AdmissionError as e:
+            # Shed by the queue or over quota: nothing was spent, so there is nothing to resume
+            logging.warning(f"Run {run_id} not admitted for {user_key}: {e}")
+            st.session_state.error_message = str(e)
         except Exception as e:
             # Catch any exception during the process
             logging.error(f"Error during podcast generation: {e}", exc_info=True)
-            st.session_state.error_message = f"An error occurred: {e}"
+            st.session_state.error_message = f"An error occurred: {e}. Completed steps were saved; click Generate again to resume."
             st.session_state.audio_full_path = None # Ensure paths are None on error
             st.session_state.audio_relative_path = None
         finally:
+            # Let the live player finish the parts it has; no more will be added
+            if live_playlist:
+                live_playlist.finish()
+            # Hand the run slot to the next request in the queue
+            if admission_ticket:
+                admission_controller.release(admission_ticket)
+            # Save the profile next to the episode, whether the run succeeded or not
+            if run_profiler:
+                try:
+                    _, st.session_state.profile_svg_path = run_profiler.stop()
+                except Exception as e:
+                    logging.error(f"Failed to save run profile: {e}", exc_info=True)
             # Ensure processing state is always turned off
             st.session_state.is_processing = False
-            # Rerun to update the UI immediately after processing finishes or fails
-            st.rerun()
+            # Rerun to update the UI immediately after processing finishes or fails.
+            # Skip it if the listener is already playing live segments, so playback is not cut off;
+            # the results below are rendered in this same run instead.
+            if not st.session_state.live_segment_count:
+                st.rerun()
 
 
 elif generate_button and not uploaded_files:
@@ -290,6 +468,9 @@ with col2:
                 for fname in st.session_state.failed_files_list:
                     st.caption(f"❌ {fname}")
 
+    if st.session_state.profile_svg_path:
+        st.caption(f"🔬 Profiling was on for this run. Flame graph: {st.session_state.profile_svg_path}")
+
     # Display Error Message if it occurred
     if st.session_state.error_message:
         st.error(f"🚨 {st.session_state.error_message}")
@@ -298,43 +479,29 @@ with col2:
     if st.session_state.audio_full_path and os.path.exists(st.session_state.audio_full_path):
         st.success("🎉 Your podcast is ready!")
 
-        # Embed HTML5 Audio Player using Base64 Data URL
-        try:
-            # *** CHANGE HERE: Read bytes, encode to Base64, create Data URL ***
-            with open(st.session_state.audio_full_path, "rb") as f:
-                data = f.read()
-                b64 = base64.b64encode(data).decode() # Decode to string
-                data_url = f"data:audio/mp3;base64,{b64}"
-                logging.info(f"Generated Base64 data URL (length: {len(data_url)}) for {st.session_state.audio_full_path}")
-
-            audio_html = f"""
-            <div class="audio-container">
-                <audio controls src="{data_url}">
-                    Your browser does not support the audio element. Please use the download button.
-                </audio>
-            </div>
-            """
-            st.markdown(audio_html, unsafe_allow_html=True)
-            logging.info(f"Displaying HTML5 audio player using Base64 data URL.")
-
-        except Exception as e:
-            st.error(f"Error embedding Base64 audio player: {e}")
-            logging.error(f"Error reading/encoding/displaying Base64 for {st.session_state.audio_full_path}: {e}", exc_info=True)
-
-
-        # Download Button - Use the *full* path to read the file server-side
+        # Streamlit serves the file by URL, so the audio is not inlined into every rerun
         try:
-            with open(st.session_state.audio_full_path, "rb") as file:
-                st.download_button(
-                    label="⬇️ Download Podcast (.mp3)",
-                    data=file, # Pass the file object directly for download
-                    file_name=Path(st.session_state.audio_full_path).name,
-                    mime="audio/mp3",
-                    key="download_button"
-                )
+            st.audio(st.session_state.audio_full_path, format=mime_type_for_path(st.session_state.audio_full_path))
         except Exception as e:
-            st.error(f"Error preparing download link: {e}")
-            logging.error(f"Error creating download button for {st.session_state.audio_full_path}: {e}", exc_info=True)
+            st.error(f"Error loading the audio player: {e}")
+            logging.error(f"Error displaying audio player for {st.session_state.audio_full_path}: {e}", exc_info=True)
+
+
+        # Download Buttons - Use the *full* paths to read the files server-side
+        download_paths = [st.session_state.audio_full_path] + st.session_state.audio_rendition_paths
+        for i, download_path in enumerate(download_paths):
+            try:
+                with open(download_path, "rb") as file:
+                    st.download_button(
+                        label=f"⬇️ Download Podcast ({Path(download_path).suffix})",
+                        data=file, # Pass the file object directly for download
+                        file_name=Path(download_path).name,
+                        mime=mime_type_for_path(download_path),
+                        key="download_button" if i == 0 else f"download_button_{i}"
+                    )
+            except Exception as e:
+                st.error(f"Error preparing download link: {e}")
+                logging.error(f"Error creating download button for {download_path}: {e}", exc_info=True)
 
 
     # Display message if still processing
@@ -350,10 +517,53 @@ with col2:
         st.info("Upload files and click 'Generate Podcast' to create your audio summary.")
 
 
-    # Display Generated Script (Optional)
-    if st.session_state.podcast_script:
-        with st.expander("View Generated Podcast Script", expanded=False):
-            st.text_area("Script:", value=st.session_state.podcast_script, height=300, disabled=True, key="script_display")
+    # Display Generated Script (editable; saving rebuilds only the changed paragraphs)
+    podcast_script = artifact_store.get_text(st.session_state.podcast_script_handle)
+    if podcast_script:
+        with st.expander("View & Edit Podcast Script", expanded=False):
+            edited_script = st.text_area(
+                "Script:", value=podcast_script, height=300,
+                key=f"script_editor_{st.session_state.run_id}",
+                help="Fix names, numbers or wording here. Only the paragraphs you change are re-recorded."
+            )
+            can_update = bool(st.session_state.run_id and st.session_state.audio_full_path)
+            if st.button("💾 Save & Update Audio", key="save_script_button", disabled=not can_update or st.session_state.is_processing):
+                if edited_script.strip() == podcast_script.strip():
+                    st.info("No changes to save.")
+                else:
+                    user_key = current_user_key()
+                    quota_key = current_quota_key()
+                    try:
+                        with st.spinner("Updating the changed paragraphs..."):
+                            # Edits share the global run slots with new episodes
+                            revision_ticket = admission_controller.submit(user_key)
+                            try:
+                                queue_status = st.empty()
+                                while not admission_controller.wait(revision_ticket, timeout=1):
+                                    position = admission_controller.position(revision_ticket)
+                                    eta = admission_controller.estimated_wait(position)
+                                    queue_status.info(f"⏳ Inbox.fm is busy right now. You are #{position} in line (about {max(1, round(eta / 60))} min).")
+                                queue_status.empty()
+                                revision = PipelineRun(st.session_state.run_id).revise_script(
+                                    edited_script, AUDIO_DIR,
+                                    # Only the changed paragraphs go to TTS, so only they count against the quota
+                                    before_synthesis=lambda changed_chars: user_quotas.reserve(quota_key, 0, changed_chars)
+                                )
+                            finally:
+                                admission_controller.release(revision_ticket)
+                        artifact_store.delete(st.session_state.podcast_script_handle)
+                        st.session_state.podcast_script_handle = artifact_store.put_text(st.session_state.session_id, revision["script"])
+                        st.session_state.audio_full_path = revision["audio_path"]
+                        st.session_state.audio_rendition_paths = revision["rendition_paths"]
+                        st.session_state.error_message = None
+                        logging.info(f"Script revised for run {st.session_state.run_id}: reused {revision['reused_segments']}/{revision['total_segments']} segments.")
+                        st.rerun()
+                    except AdmissionError as e:
+                        logging.warning(f"Script revision for run {st.session_state.run_id} not admitted for {user_key}: {e}")
+                        st.error(str(e))
+                    except Exception as e:
+                        st.error(f"Could not update the audio: {e}")
+                        logging.error(f"Error revising script for run {st.session_state.run_id}: {e}", exc_info=True)
 
 
 # --- Footer ---
@@ -0,0 +1,189 @@
+import os
+import mmap
+import time
+import uuid
+import shutil
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Where session artifacts are spilled. One subdirectory per session.
+ARTIFACT_DIR = os.getenv("INBOXFM_ARTIFACT_DIR", os.path.join(tempfile.gettempdir(), "inboxfm_artifacts"))
+# Ceiling for artifact bytes held in memory across ALL sessions of this process.
+MEMORY_CEILING_BYTES = int(os.getenv("INBOXFM_ARTIFACT_MEMORY_MB", "128")) * 1024 * 1024
+# Sessions untouched for this long have their artifacts deleted.
+SESSION_IDLE_SECONDS = int(os.getenv("INBOXFM_SESSION_IDLE_SECONDS", "1800"))
+# Minimum interval between idle-session sweeps.
+EVICTION_INTERVAL_SECONDS = 60
+
+
+class ArtifactStore:
+    """
+    Disk-backed store for large per-session artifacts (extracted text, scripts).
+
+    Session state keeps only the opaque string handles returned by the put_*
+    methods. Payloads live on disk and are read through memory maps; recently
+    used payloads are kept in a process-wide in-memory LRU cache bounded by
+    `memory_ceiling` bytes. Sessions idle for longer than `idle_seconds` are
+    evicted together with their files.
+    """
+    def __init__(self, root_dir=ARTIFACT_DIR, memory_ceiling=MEMORY_CEILING_BYTES, idle_seconds=SESSION_IDLE_SECONDS):
+        self.root_dir = root_dir
+        self.memory_ceiling = memory_ceiling
+        self.idle_seconds = idle_seconds
+        os.makedirs(self.root_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._hot = OrderedDict()        # handle -> bytes, most recently used last
+        self._hot_bytes = 0
+        self._last_seen = {}             # session_id -> timestamp
+        self._last_sweep = 0.0
+
+    # --- Handles ---
+
+    def _path(self, handle):
+        session_id, name = handle.split("/", 1)
+        return os.path.join(self.root_dir, session_id, name)
+
+    def _new_handle(self, session_id, kind):
+        return f"{session_id}/{uuid.uuid4().hex}.{kind}"
+
+    # --- Writes ---
+
+    def put_bytes(self, session_id, data, kind="bin"):
+        """
+        Stores `data` for a session and returns its handle.
+
+        Args:
+            session_id (str): Owning session.
+            data (bytes): Payload.
+            kind (str): Short label used as file suffix (e.g. "txt", "bin").
+
+        Returns:
+            str: Handle to keep in session state.
+        """
+        handle = self._new_handle(session_id, kind)
+        path = self._path(handle)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.touch(session_id)
+        logging.info(f"Stored artifact {handle} ({len(data)} bytes)")
+        return handle
+
+    def put_text(self, session_id, text, kind="txt"):
+        """Stores a UTF-8 string and returns its handle."""
+        return self.put_bytes(session_id, text.encode("utf-8"), kind)
+
+    def delete(self, handle):
+        """Removes one artifact (no-op if it is already gone)."""
+        if not handle:
+            return
+        with self._lock:
+            data = self._hot.pop(handle, None)
+            if data is not None:
+                self._hot_bytes -= len(data)
+        try:
+            os.remove(self._path(handle))
+        except FileNotFoundError:
+            pass
+
+    # --- Reads ---
+
+    def get_bytes(self, handle):
+        """
+        Returns the payload for `handle`, or None if it no longer exists
+        (e.g. the session was evicted).
+        """
+        if not handle:
+            return None
+        with self._lock:
+            data = self._hot.get(handle)
+            if data is not None:
+                self._hot.move_to_end(handle)
+                return data
+        try:
+            with open(self._path(handle), "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    data = b""
+                else:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        data = mapped[:]
+        except FileNotFoundError:
+            logging.warning(f"Artifact {handle} not found (evicted?)")
+            return None
+        self._remember(handle, data)
+        return data
+
+    def get_text(self, handle):
+        """Returns the string stored under `handle`, or None if it no longer exists."""
+        data = self.get_bytes(handle)
+        return data.decode("utf-8") if data is not None else None
+
+    def _remember(self, handle, data):
+        """Adds a payload to the in-memory cache, evicting least recently used entries over the ceiling."""
+        if len(data) > self.memory_ceiling:
+            return
+        with self._lock:
+            if handle in self._hot:
+                return
+            self._hot[handle] = data
+            self._hot_bytes += len(data)
+            while self._hot_bytes > self.memory_ceiling:
+                _, evicted = self._hot.popitem(last=False)
+                self._hot_bytes -= len(evicted)
+
+    # --- Sessions ---
+
+    def touch(self, session_id):
+        """Marks a session as active now."""
+        with self._lock:
+            self._last_seen[session_id] = time.time()
+
+    def release_session(self, session_id):
+        """Deletes every artifact of a session and forgets it."""
+        prefix = f"{session_id}/"
+        with self._lock:
+            for handle in [h for h in self._hot if h.startswith(prefix)]:
+                self._hot_bytes -= len(self._hot.pop(handle))
+            self._last_seen.pop(session_id, None)
+        shutil.rmtree(os.path.join(self.root_dir, session_id), ignore_errors=True)
+        logging.info(f"Released artifacts of session {session_id}")
+
+    def evict_idle_sessions(self, force=False):
+        """
+        Releases sessions idle for longer than `idle_seconds`. Runs at most once
+        per EVICTION_INTERVAL_SECONDS unless `force` is set.
+
+        Returns:
+            list: IDs of the evicted sessions.
+        """
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_sweep < EVICTION_INTERVAL_SECONDS:
+                return []
+            self._last_sweep = now
+            idle = [sid for sid, seen in self._last_seen.items() if now - seen > self.idle_seconds]
+        # Directories left behind by a previous process are idle by definition
+        known = set(self._last_seen)
+        for entry in os.listdir(self.root_dir):
+            entry_path = os.path.join(self.root_dir, entry)
+            if entry not in known and os.path.isdir(entry_path) and now - os.path.getmtime(entry_path) > self.idle_seconds:
+                idle.append(entry)
+        for session_id in idle:
+            self.release_session(session_id)
+        return idle
+
+    def memory_usage(self):
+        """Bytes currently held in the in-memory cache."""
+        with self._lock:
+            return self._hot_bytes
+
+
+# One store per server process, shared by all sessions.
+artifact_store = ArtifactStore()
@@ -0,0 +1,152 @@
+import os
+import time
+import shutil
+import logging
+import subprocess
+from pathlib import Path
+from collections import namedtuple
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# An audio format profile.
+#   tts_model / tts_format: what to request from the TTS API when the profile is synthesized directly.
+#   ffmpeg_args: encoder arguments used when the profile is transcoded from a lossless master.
+#   requires_transcode: True if the direct TTS output does not meet the profile (e.g. bitrate/channels),
+#                       so the profile is only honored exactly when ffmpeg is available.
+AudioProfile = namedtuple(
+    "AudioProfile",
+    ["name", "label", "extension", "mime_type", "tts_model", "tts_format", "ffmpeg_args", "requires_transcode"],
+)
+
+AUDIO_PROFILES = {
+    "standard": AudioProfile(
+        name="standard",
+        label="Standard (MP3)",
+        extension="mp3",
+        mime_type="audio/mpeg",
+        tts_model="tts-1",
+        tts_format="mp3",
+        ffmpeg_args=["-c:a", "libmp3lame", "-b:a", "128k"],
+        requires_transcode=False,
+    ),
+    "speech": AudioProfile(
+        name="speech",
+        label="Speech-optimized (64 kbps mono MP3)",
+        extension="mp3",
+        mime_type="audio/mpeg",
+        tts_model="tts-1",
+        tts_format="mp3",
+        ffmpeg_args=["-c:a", "libmp3lame", "-b:a", "64k", "-ac", "1"],
+        requires_transcode=True,
+    ),
+    "mobile": AudioProfile(
+        name="mobile",
+        label="Low bandwidth (Opus)",
+        extension="opus",
+        mime_type="audio/ogg",
+        tts_model="tts-1",
+        tts_format="opus",
+        ffmpeg_args=["-c:a", "libopus", "-b:a", "24k", "-ac", "1", "-application", "voip"],
+        requires_transcode=False,
+    ),
+    "hq": AudioProfile(
+        name="hq",
+        label="High quality download (FLAC)",
+        extension="flac",
+        mime_type="audio/flac",
+        tts_model="tts-1-hd",
+        tts_format="flac",
+        ffmpeg_args=["-c:a", "flac"],
+        requires_transcode=False,
+    ),
+}
+
+DEFAULT_AUDIO_PROFILE = "standard"
+
+# Lossless format requested from the TTS API when renditions are transcoded locally.
+MASTER_FORMAT = "flac"
+
+# TTS models from lowest to highest quality. A master that feeds several profiles is
+# synthesized with the best model any of them asks for.
+TTS_MODEL_QUALITY = ["tts-1", "tts-1-hd"]
+
+def get_audio_profile(name):
+    """
+    Looks up an audio profile by name.
+
+    Args:
+        name (str or AudioProfile): Profile name (e.g. "mobile") or a profile.
+
+    Returns:
+        AudioProfile: The matching profile.
+
+    Raises:
+        ValueError: If the profile name is unknown.
+    """
+    if isinstance(name, AudioProfile):
+        return name
+    try:
+        return AUDIO_PROFILES[name or DEFAULT_AUDIO_PROFILE]
+    except KeyError:
+        raise ValueError(f"Unknown audio profile '{name}'. Choose from: {', '.join(AUDIO_PROFILES)}")
+
+def master_tts_model(profiles):
+    """Returns the TTS model for a lossless master that all of `profiles` are transcoded from."""
+    models = [get_audio_profile(profile).tts_model for profile in profiles]
+    return max(models, key=lambda model: TTS_MODEL_QUALITY.index(model) if model in TTS_MODEL_QUALITY else -1)
+
+def audio_filename(stem, profile):
+    """Returns the file name for an episode stem in the given profile (e.g. 'ep.opus')."""
+    return f"{stem}.{get_audio_profile(profile).extension}"
+
+def rendition_path(primary_path, profile):
+    """
+    Returns where the rendition of an episode in `profile` is stored.
+
+    Renditions live next to the primary file as '<stem>.<profile>.<ext>', so two
+    profiles sharing an extension (standard/speech) never collide.
+    """
+    profile = get_audio_profile(profile)
+    primary = Path(primary_path)
+    return str(primary.with_name(f"{primary.stem}.{profile.name}.{profile.extension}"))
+
+def mime_type_for_path(file_path):
+    """Guesses the MIME type of an audio file produced by one of the profiles."""
+    extension = Path(file_path).suffix.lower().lstrip(".")
+    for profile in AUDIO_PROFILES.values():
+        if profile.extension == extension:
+            return profile.mime_type
+    return "application/octet-stream"
+
+def ffmpeg_available():
+    """True if an ffmpeg binary is on PATH (required for local transcoding)."""
+    return shutil.which("ffmpeg") is not None
+
+def transcode(source_path, output_path, profile):
+    """
+    Encodes `source_path` into `output_path` using the profile's encoder settings.
+
+    Args:
+        source_path (str): Input audio file (usually the lossless master).
+        output_path (str): Destination file.
+        profile (str or AudioProfile): Target profile.
+
+    Returns:
+        float: Encode wall time in seconds.
+
+    Raises:
+        RuntimeError: If ffmpeg is missing or the encode fails.
+    """
+    profile = get_audio_profile(profile)
+    if not ffmpeg_available():
+        raise RuntimeError("ffmpeg is not installed; cannot transcode audio.")
+
+    command = ["ffmpeg", "-y", "-loglevel", "error", "-i", source_path, *profile.ffmpeg_args, output_path]
+    start = time.perf_counter()
+    result = subprocess.run(command, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to encode {profile.name}: {result.stderr.strip()}")
+    logging.info(f"Transcoded {source_path} -> {output_path} ({profile.name}) in {elapsed:.2f}s, {os.path.getsize(output_path)} bytes")
+    return elapsed
@@ -0,0 +1,82 @@
+"""
+Compares the audio profiles by output size and local encode time.
+
+Usage:
+    python benchmark_audio_formats.py --source episode.flac
+    python benchmark_audio_formats.py --script script.txt --voice nova
+
+With --source, an existing (ideally lossless) recording is transcoded into every
+profile. With --script, the text is first synthesized once into a lossless master
+via the TTS API, then transcoded. Requires ffmpeg on PATH.
+"""
+import os
+import argparse
+import tempfile
+
+from audio_formats import AUDIO_PROFILES, MASTER_FORMAT, ffmpeg_available, transcode
+
+def run_benchmark(source_path, profile_names, repeats=3):
+    """
+    Transcodes `source_path` into each profile and measures size and encode time.
+
+    Args:
+        source_path (str): Input audio file.
+        profile_names (list): Profile names to benchmark.
+        repeats (int): Encodes per profile; the fastest run is reported.
+
+    Returns:
+        list: One dict per profile with name, bytes, ratio and encode_seconds.
+    """
+    source_size = os.path.getsize(source_path)
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name in profile_names:
+            profile = AUDIO_PROFILES[name]
+            output_path = os.path.join(work_dir, f"bench.{profile.name}.{profile.extension}")
+            timings = [transcode(source_path, output_path, profile) for _ in range(repeats)]
+            size = os.path.getsize(output_path)
+            results.append({
+                "name": name,
+                "bytes": size,
+                "ratio": size / source_size if source_size else 0.0,
+                "encode_seconds": min(timings),
+            })
+    return results
+
+def print_report(source_path, results):
+    """Prints the benchmark results as a plain-text table."""
+    print(f"Source: {source_path} ({os.path.getsize(source_path) / 1024:.1f} KiB)")
+    print(f"{'profile':<10} {'size KiB':>10} {'vs source':>10} {'encode s':>10}")
+    for row in results:
+        print(f"{row['name']:<10} {row['bytes'] / 1024:>10.1f} {row['ratio']:>9.1%} {row['encode_seconds']:>10.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Inbox.fm audio profiles (size vs encode time).")
+    source_group = parser.add_mutually_exclusive_group(required=True)
+    source_group.add_argument("--source", help="Existing audio file to transcode.")
+    source_group.add_argument("--script", help="Text file to synthesize once into a lossless master.")
+    parser.add_argument("--voice", default="nova", help="TTS voice used with --script.")
+    parser.add_argument("--profiles", nargs="+", default=list(AUDIO_PROFILES), choices=list(AUDIO_PROFILES))
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    if not ffmpeg_available():
+        parser.error("ffmpeg is required for this benchmark.")
+
+    if args.source:
+        print_report(args.source, run_benchmark(args.source, args.profiles, args.repeats))
+        return
+
+    # Imported lazily so --source works without API credentials
+    from utils import jarvis
+    if not jarvis:
+        parser.error("--script requires OPENAI_API_KEY to synthesize the master.")
+    with open(args.script, 'r', encoding='utf-8') as f:
+        script_text = f.read()
+    with tempfile.TemporaryDirectory() as work_dir:
+        master_path = os.path.join(work_dir, f"master.{MASTER_FORMAT}")
+        jarvis.generate_audio(script_text, master_path, voice=args.voice, response_format=MASTER_FORMAT)
+        print_report(master_path, run_benchmark(master_path, args.profiles, args.repeats))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Compares the streaming DOCX reader with the python-docx reader it replaced.
+
+Usage:
+    python benchmark_docx.py --docx newsletter.docx
+    python benchmark_docx.py --generate 20000 --tables 200
+
+With --docx, an existing file is read. With --generate, a synthetic newsletter
+with the given number of paragraphs (and tables of market data) is built with
+python-docx first. Each reader runs in a fresh process so its peak memory
+(max RSS, which includes lxml's C allocations) is measured in isolation.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+
+READERS = ["python-docx", "streaming"]
+
+def read_with_python_docx(file_path):
+    """The previous GenAI.read_docx: full object model, paragraphs only."""
+    from docx import Document
+    doc = Document(file_path)
+    return '\n'.join(para.text for para in doc.paragraphs)
+
+def read_with_streaming(file_path):
+    """The current GenAI.read_docx."""
+    from docx_reader import read_docx_text
+    return read_docx_text(file_path)
+
+def _peak_rss_mb():
+    # Prefer VmHWM: on Linux ru_maxrss survives fork/exec and would include the parent's peak
+    try:
+        with open("/proc/self/status", 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is reported in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def measure(reader, file_path):
+    """Reads `file_path` with one reader (in this process) and returns timing and memory."""
+    read_fn = read_with_streaming if reader == "streaming" else read_with_python_docx
+    baseline_mb = _peak_rss_mb()
+    started = time.perf_counter()
+    text = read_fn(file_path)
+    return {
+        "reader": reader,
+        "seconds": time.perf_counter() - started,
+        "peak_rss_mb": _peak_rss_mb(),
+        "rss_growth_mb": _peak_rss_mb() - baseline_mb,
+        "chars": len(text),
+        "lines": text.count("\n") + 1 if text else 0,
+    }
+
+def run_benchmark(file_path, repeats=3):
+    """
+    Measures every reader in fresh subprocesses.
+
+    Args:
+        file_path (str): The .docx file.
+        repeats (int): Runs per reader; the fastest run is reported.
+
+    Returns:
+        list: One dict per reader with seconds, peak_rss_mb, rss_growth_mb, chars and lines.
+    """
+    results = []
+    for reader in READERS:
+        runs = []
+        for _ in range(repeats):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--measure", reader, file_path],
+                capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+            ).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        results.append(min(runs, key=lambda run: run["seconds"]))
+    return results
+
+def generate_newsletter(file_path, paragraphs, tables):
+    """Builds a synthetic newsletter .docx with python-docx."""
+    from docx import Document
+    doc = Document()
+    tables_every = max(1, paragraphs // max(1, tables)) if tables else 0
+    for i in range(paragraphs):
+        doc.add_paragraph(f"Story {i}: markets moved as analysts weighed the latest earnings, rates and guidance. " * 3)
+        if tables_every and i % tables_every == tables_every - 1:
+            table = doc.add_table(rows=6, cols=4)
+            for r, row in enumerate(table.rows):
+                for c, cell in enumerate(row.cells):
+                    cell.text = "Ticker" if r == 0 and c == 0 else f"{r * 1.5 + c:.2f}%"
+    doc.save(file_path)
+
+def print_report(file_path, results):
+    """Prints the benchmark results as a plain-text table."""
+    print(f"Source: {file_path} ({os.path.getsize(file_path) / 1024:.1f} KiB)")
+    print(f"{'reader':<12} {'seconds':>9} {'peak MB':>9} {'growth MB':>10} {'chars':>10} {'lines':>8}")
+    for row in results:
+        print(f"{row['reader']:<12} {row['seconds']:>9.3f} {row['peak_rss_mb']:>9.1f} {row['rss_growth_mb']:>10.1f} {row['chars']:>10} {row['lines']:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Inbox.fm DOCX extraction (streaming vs python-docx).")
+    source_group = parser.add_mutually_exclusive_group(required=True)
+    source_group.add_argument("--docx", help="Existing .docx file to read.")
+    source_group.add_argument("--generate", type=int, metavar="PARAGRAPHS", help="Build a synthetic newsletter with this many paragraphs.")
+    source_group.add_argument("--measure", nargs=2, metavar=("READER", "PATH"), help=argparse.SUPPRESS)
+    parser.add_argument("--tables", type=int, default=50, help="Tables in the synthetic newsletter.")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        return
+
+    if args.docx:
+        print_report(args.docx, run_benchmark(args.docx, args.repeats))
+        return
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        file_path = os.path.join(work_dir, "newsletter.docx")
+        generate_newsletter(file_path, args.generate, args.tables)
+        print_report(file_path, run_benchmark(file_path, args.repeats))
+
+if __name__ == "__main__":
+    main()
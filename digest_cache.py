@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Directory where digests are persisted so they survive app restarts.
+# Shared by every session served from this checkout.
+DIGEST_CACHE_DIR = os.getenv("INBOXFM_DIGEST_CACHE_DIR", "digest_cache")
+# Digests kept in memory (least recently used are dropped; disk keeps them all).
+DIGEST_MEMORY_ENTRIES = int(os.getenv("INBOXFM_DIGEST_MEMORY_ENTRIES", "512"))
+
+def content_hash(text):
+    """
+    Returns a stable SHA-256 hex digest identifying a newsletter document.
+
+    Whitespace at the start/end of each line is ignored, so the same issue
+    extracted from a PDF and from a DOCX export usually maps to the same key.
+
+    Args:
+        text (str): The document text.
+
+    Returns:
+        str: 64-character hex digest.
+    """
+    normalized = "\n".join(line.strip() for line in text.strip().splitlines() if line.strip())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class _InFlight:
+    """A digest computation that other callers can wait on."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.digest = None
+        self.error = None
+
+
+class DigestCache:
+    """
+    Global, content-addressed cache of newsletter digests.
+
+    Every distinct document is summarized once; later requests for the same
+    document (from any session) reuse the stored digest. Concurrent requests
+    for a document that is still being summarized wait for the single
+    in-flight computation instead of issuing their own API calls.
+
+    Digests are persisted as JSON files under `cache_dir`; the most recently
+    used `memory_entries` of them are also kept in memory.
+    The in-flight de-duplication is per process, which matches how Streamlit
+    serves sessions (threads within one server process).
+    """
+    def __init__(self, cache_dir=DIGEST_CACHE_DIR, memory_entries=DIGEST_MEMORY_ENTRIES):
+        self.cache_dir = cache_dir
+        self.memory_entries = memory_entries
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._memory = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load(self, key):
+        """Reads a persisted digest, or returns None if it is missing/unreadable."""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f).get("digest")
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable digest cache entry {path}: {e}")
+            return None
+
+    def _store(self, key, digest):
+        """Persists a digest atomically so readers never see a partial file."""
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"digest": digest, "created_at": time.time()}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.error(f"Failed to persist digest {key}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _remember(self, key, digest):
+        # Caller holds the lock
+        self._memory[key] = digest
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_or_compute(self, text, compute_fn):
+        """
+        Returns the digest for `text`, computing it with `compute_fn` at most once.
+
+        Args:
+            text (str): The newsletter document text.
+            compute_fn (callable): Called as `compute_fn(text)` on a cache miss;
+                must return the digest string.
+
+        Returns:
+            str: The digest for the document.
+
+        Raises:
+            Exception: Whatever `compute_fn` raised, re-raised in every caller
+                that was waiting on the failed computation.
+        """
+        key = content_hash(text)
+        with self._lock:
+            if key in self._memory:
+                logging.info(f"Digest cache hit (memory) for document {key[:12]}.")
+                self._memory.move_to_end(key)
+                return self._memory[key]
+            flight = self._in_flight.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = _InFlight()
+                self._in_flight[key] = flight
+
+        if not is_leader:
+            logging.info(f"Waiting on in-flight digest for document {key[:12]}.")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.digest
+
+        try:
+            digest = self._load(key)
+            if digest is not None:
+                logging.info(f"Digest cache hit (disk) for document {key[:12]}.")
+            else:
+                logging.info(f"Digest cache miss for document {key[:12]}; computing.")
+                digest = compute_fn(text)
+                if not digest:
+                    raise RuntimeError("Digest generation returned no content.")
+                self._store(key, digest)
+            with self._lock:
+                self._remember(key, digest)
+            flight.digest = digest
+            return digest
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            flight.done.set()
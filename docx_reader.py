@@ -0,0 +1,136 @@
+import logging
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# WordprocessingML namespaces (transitional and strict OOXML).
+WORD_NAMESPACES = (
+    "http://schemas.openxmlformats.org/wordprocessingml/2006/main",
+    "http://purl.oclc.org/ooxml/wordprocessingml/main",
+)
+MARKUP_COMPATIBILITY_NAMESPACE = "http://schemas.openxmlformats.org/markup-compatibility/2006"
+OFFICE_DOCUMENT_RELATIONSHIP = "/officeDocument"
+DEFAULT_DOCUMENT_PART = "word/document.xml"
+
+# Separator between the cells of a table row.
+TABLE_CELL_SEPARATOR = " | "
+
+def _word_tag(element_tag):
+    """Returns the local name of a WordprocessingML tag, or None for other namespaces."""
+    namespace, _, local_name = element_tag[1:].partition("}")
+    return local_name if namespace in WORD_NAMESPACES else None
+
+def _main_document_part(archive):
+    """Finds the main document part through the package relationships (usually word/document.xml)."""
+    try:
+        with archive.open("_rels/.rels") as rels:
+            for _, element in ET.iterparse(rels):
+                if element.get("Type", "").endswith(OFFICE_DOCUMENT_RELATIONSHIP):
+                    return posixpath.normpath(element.get("Target", DEFAULT_DOCUMENT_PART).lstrip("/"))
+    except KeyError:
+        pass
+    return DEFAULT_DOCUMENT_PART
+
+def iter_docx_blocks(file_path):
+    """
+    Streams the body of a DOCX file as text blocks, in document order.
+
+    The main document XML is decompressed and parsed incrementally straight
+    from the zip archive, and every finished block is discarded, so memory
+    stays flat regardless of document size.
+
+    Args:
+        file_path (str): Path to the .docx file.
+
+    Yields:
+        str: One paragraph, or one table row with its cells joined by " | ".
+            Nested tables are flattened into the enclosing cell; text boxes are
+            merged into the paragraph that anchors them.
+
+    Raises:
+        zipfile.BadZipFile: If the file is not a DOCX (zip) archive.
+        KeyError: If the archive has no main document part.
+        xml.etree.ElementTree.ParseError: If the document XML is malformed.
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        with archive.open(_main_document_part(archive)) as document:
+            paragraphs = [] # Text pieces of the open paragraphs (text boxes nest paragraphs)
+            cells = [] # Text of the open table cells (nested tables nest cells)
+            rows = [] # Cell texts of the open table rows
+            body = None
+            depth = 0
+            fallback_depth = 0 # Inside mc:Fallback, which repeats mc:Choice content
+            run_depth = 0 # Inside a run (<w:r>); tab stops in <w:pPr><w:tabs> are not text
+
+            for event, element in ET.iterparse(document, events=("start", "end")):
+                if event == "start":
+                    depth += 1
+                    if fallback_depth or element.tag == f"{{{MARKUP_COMPATIBILITY_NAMESPACE}}}Fallback":
+                        fallback_depth += 1
+                        continue
+                    tag = _word_tag(element.tag)
+                    if tag == "body":
+                        body = element
+                    elif tag == "p":
+                        paragraphs.append([])
+                    elif tag == "r":
+                        run_depth += 1
+                    elif tag == "tc":
+                        cells.append([])
+                    elif tag == "tr":
+                        rows.append([])
+                    continue
+
+                depth -= 1
+                if fallback_depth:
+                    fallback_depth -= 1
+                    continue
+                tag = _word_tag(element.tag)
+                if tag == "t" and paragraphs:
+                    paragraphs[-1].append(element.text or "")
+                elif tag == "r":
+                    run_depth -= 1
+                elif tag == "tab" and run_depth and paragraphs:
+                    paragraphs[-1].append("\t")
+                elif tag in ("br", "cr") and run_depth and paragraphs:
+                    paragraphs[-1].append("\n")
+                elif tag == "p":
+                    text = "".join(paragraphs.pop())
+                    if paragraphs:
+                        # A text box paragraph inside another paragraph
+                        paragraphs[-1].append(f" {text} " if text else "")
+                    elif cells:
+                        cells[-1].append(text)
+                    else:
+                        yield text
+                    element.clear()
+                elif tag == "tc":
+                    cell_parts = cells.pop()
+                    if rows:
+                        rows[-1].append(" ".join(part.strip() for part in cell_parts if part.strip()))
+                elif tag == "tr":
+                    row_text = TABLE_CELL_SEPARATOR.join(rows.pop())
+                    if cells:
+                        cells[-1].append(row_text)
+                    elif row_text.strip(" |"):
+                        yield row_text
+                    element.clear()
+
+                # Direct children of <w:body> are finished blocks: drop them from the tree
+                if body is not None and depth == 2:
+                    body.clear()
+
+def read_docx_text(file_path):
+    """
+    Reads the text of a DOCX file (paragraphs and table rows) as one string.
+
+    Args:
+        file_path (str): Path to the .docx file.
+
+    Returns:
+        str: Blocks separated by newlines.
+    """
+    return "\n".join(iter_docx_blocks(file_path))
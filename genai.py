@@ -1,48 +1,51 @@
 # Standard library imports
-import os
-import base64
-import time
-import tempfile
 import logging
 
 # Third-party imports
 import openai
 import PyPDF2
-from docx import Document
+
+# Local imports
+from providers import get_provider
+from ocr import needs_ocr, page_fingerprint, ocr_pdf_pages
+from docx_reader import read_docx_text
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 class GenAI:
     """
-    A class for interacting with the OpenAI API to generate text,
-    perform text-to-speech, and handle basic document processing tasks.
+    A class for generating text and speech through a pluggable provider backend
+    (see providers.py) and handling basic document processing tasks.
 
     Attributes:
     ----------
-    client : openai.Client
-        An instance of the OpenAI client initialized with the API key.
+    provider : providers.Provider
+        The backend used for text generation and text-to-speech.
     openai_api_key : str
-        The OpenAI API key.
+        The OpenAI API key (None for backends that do not need one).
     """
-    def __init__(self, openai_api_key):
+    def __init__(self, openai_api_key=None, provider=None):
         """
-        Initializes the GenAI class with the provided OpenAI API key.
+        Initializes the GenAI class with a provider backend.
 
         Parameters:
         ----------
-        openai_api_key : str
-            The API key for accessing OpenAI's services.
+        openai_api_key : str, optional
+            The API key for accessing OpenAI's services (required by the OpenAI provider).
+        provider : providers.Provider or str, optional
+            A provider instance or name ("openai", "local"). Defaults to the
+            INBOXFM_PROVIDER environment variable, then "openai".
         """
-        if not openai_api_key:
-            raise ValueError("OpenAI API key is required.")
-        self.client = openai.Client(api_key=openai_api_key)
+        if provider is None or isinstance(provider, str):
+            provider = get_provider(provider, openai_api_key=openai_api_key)
+        self.provider = provider
         self.openai_api_key = openai_api_key
-        logging.info("GenAI client initialized.")
+        logging.info(f"GenAI client initialized with the '{provider.name}' provider.")
 
-    def generate_text(self, prompt, instructions='You are a helpful AI podcast generator.', model="gpt-4o", output_type='text', temperature=0.7):
+    def generate_text(self, prompt, instructions='You are a helpful AI podcast generator.', model="gpt-4o", output_type='text', temperature=0.7, timeout=None, on_usage=None, max_retries=None):
         """
-        Generates a text completion using the OpenAI API.
+        Generates a text completion using the configured provider.
 
         Parameters:
         ----------
@@ -51,11 +54,19 @@ class GenAI:
         instructions : str, optional
             System-level instructions for the AI's behavior.
         model : str, optional
-            The OpenAI model to use.
+            The model to use (the local provider may ignore it).
         output_type : str, optional
             The format of the output (currently only 'text' supported effectively here).
         temperature : float, optional
             Controls randomness in the generation.
+        timeout : float, optional
+            Request timeout in seconds (client default if None).
+        max_retries : int, optional
+            Client-side retries (client default if None). Routed calls pass 0 so
+            the model router falls back as soon as the timeout expires.
+        on_usage : callable, optional
+            Called with a dict of token usage (model, prompt_tokens, cached_tokens,
+            completion_tokens) from the API response, including provider prompt-cache hits.
 
         Returns:
         -------
@@ -69,16 +80,10 @@ class GenAI:
         """
         logging.info(f"Generating text with model {model} and temperature {temperature}.")
         try:
-            completion = self.client.chat.completions.create(
-                model=model,
-                temperature=temperature,
-                # response_format={"type": output_type}, # May cause issues depending on model/output
-                messages=[
-                    {"role": "system", "content": instructions},
-                    {"role": "user", "content": prompt}
-                ]
+            response = self.provider.generate_text(
+                prompt, instructions, model, temperature=temperature, timeout=timeout, on_usage=on_usage,
+                max_retries=max_retries
             )
-            response = completion.choices[0].message.content
             logging.info("Text generation successful.")
             # Basic cleaning, might need refinement
             response = response.replace("```json", "").replace("```", "").strip()
@@ -90,9 +95,9 @@ class GenAI:
             logging.error(f"Unexpected error during text generation: {e}")
             raise
 
-    def generate_audio(self, text, file_path, model='tts-1', voice='nova', speed=1.0):
+    def generate_audio(self, text, file_path, model='tts-1', voice='nova', speed=1.0, response_format='mp3'):
         """
-        Generates an audio file from text using OpenAI's TTS model.
+        Generates an audio file from text using the configured provider's TTS.
 
         Parameters
         ----------
@@ -101,11 +106,13 @@ class GenAI:
         file_path : str
             The output file path for the generated audio (e.g., 'podcast.mp3').
         model : str, optional
-            The OpenAI TTS model (e.g., 'tts-1', 'tts-1-hd').
+            The TTS model (e.g., 'tts-1', 'tts-1-hd').
         voice : str, optional
             The voice to use ('alloy', 'echo', 'fable', 'onyx', 'nova', 'shimmer').
         speed : float, optional
             Speech speed multiplier (0.25 to 4.0).
+        response_format : str, optional
+            The audio encoding to produce ('mp3', 'opus', 'aac', 'flac', 'wav', 'pcm').
 
         Returns
         -------
@@ -122,16 +129,9 @@ class GenAI:
         if not (0.25 <= speed <= 4.0):
             raise ValueError("Speed must be between 0.25 and 4.0")
 
-        logging.info(f"Generating audio with model {model}, voice {voice}, speed {speed}.")
+        logging.info(f"Generating {response_format} audio with model {model}, voice {voice}, speed {speed}.")
         try:
-            response = self.client.audio.speech.create(
-                model=model,
-                voice=voice,
-                input=text,
-                speed=speed
-            )
-            # Stream the audio content to the specified file
-            response.stream_to_file(file_path)
+            self.provider.generate_audio(text, file_path, model, voice, speed=speed, response_format=response_format)
             logging.info(f"Audio successfully generated and saved to {file_path}.")
             return True
         except openai.APIError as e:
@@ -152,30 +152,37 @@ class GenAI:
             raise
 
     def read_pdf(self, file_path):
-        """Reads text content from a PDF file."""
+        """Reads text content from a PDF file, OCRing pages that have no text layer (see ocr.py)."""
         logging.info(f"Reading PDF file: {file_path}")
         text = ""
         try:
             with open(file_path, 'rb') as file:
                 reader = PyPDF2.PdfReader(file)
-                for page in reader.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n" # Add newline between pages
-            logging.info(f"Successfully read {len(reader.pages)} pages from PDF: {file_path}")
+                page_texts = [page.extract_text() for page in reader.pages]
+                # Image-only (scanned) pages fall back to OCR, in parallel and cached per page
+                ocr_candidates = {
+                    index: page_fingerprint(reader.pages[index])
+                    for index, page_text in enumerate(page_texts) if needs_ocr(page_text)
+                }
+            if ocr_candidates:
+                for index, ocr_text in ocr_pdf_pages(file_path, ocr_candidates).items():
+                    page_texts[index] = ocr_text
+            for page_text in page_texts:
+                if page_text:
+                    text += page_text + "\n" # Add newline between pages
+            logging.info(f"Successfully read {len(reader.pages)} pages from PDF: {file_path} ({len(ocr_candidates)} needed OCR)")
             return text
         except Exception as e:
             logging.error(f"Error reading PDF file {file_path}: {e}")
             raise
 
     def read_docx(self, file_path):
-        """Reads text content from a DOCX file."""
+        """Reads text content (paragraphs and table rows) from a DOCX file by streaming its XML (see docx_reader.py)."""
         logging.info(f"Reading DOCX file: {file_path}")
         try:
-            doc = Document(file_path)
-            full_text = [para.text for para in doc.paragraphs]
+            text = read_docx_text(file_path)
             logging.info(f"Successfully read DOCX file: {file_path}")
-            return '\n'.join(full_text)
+            return text
         except Exception as e:
             logging.error(f"Error reading DOCX file {file_path}: {e}")
             raise
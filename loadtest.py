@@ -0,0 +1,395 @@
+"""
+Concurrent-session load test for the Inbox.fm Streamlit app.
+
+Drives N simulated sessions through generation (pipeline.PipelineRun.execute:
+extract, script, synthesize and assemble, with their checkpoints and the quota
+check before the first API call) and playback (a full run of app.py through
+Streamlit's AppTest with the finished episode in session state), against a
+local fake OpenAI backend. For each concurrency level it records latency
+percentiles per stage, throughput and peak process memory, and writes a JSON
+report that can be compared with a previous release's report.
+
+Streamlit's AppTest cannot drive st.file_uploader, so generation runs the same
+pipeline the "Generate Podcast" handler runs, with the same options and hooks.
+
+Usage:
+    python loadtest.py --concurrency 1 4 16 --sessions 16
+    python loadtest.py --concurrency 8 --compare loadtest_report_previous.json
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+import logging
+import platform
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+
+# A silent MPEG-1 Layer III frame (128 kbps, 44.1 kHz); repeated to build fake TTS output.
+SILENT_MP3_FRAME = b"\xff\xfb\x90\x64" + b"\x00" * 413
+
+SAMPLE_NEWSLETTER = """Markets Weekly
+
+Stocks closed higher on Friday after the central bank signalled a pause in rate hikes.
+Venture funding for AI infrastructure reached a new quarterly record, led by three large rounds.
+
+In other news, a major cloud provider announced price cuts for GPU instances, which analysts expect
+to pressure smaller competitors. Bond yields eased slightly and the dollar weakened against the euro.
+"""
+
+STAGES = ["queue", "extract", "script", "synthesize", "assemble", "playback", "total"]
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI-compatible endpoints: chat completions and audio speech."""
+    # Set by FakeOpenAIServer
+    chat_latency = 0.0
+    tts_latency = 0.0
+    audio_bytes_per_char = 1000
+
+    def log_message(self, format, *args):
+        pass # Keep the load test output readable
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_POST(self):
+        body = self._read_json()
+        if self.path.endswith("/chat/completions"):
+            time.sleep(self.chat_latency)
+            prompt_chars = sum(len(m.get("content") or "") for m in body.get("messages", []))
+            content = "\n\n".join(
+                f"Paragraph {i + 1}. Here is a key insight from this week's newsletters, with numbers and context for the listener."
+                for i in range(12)
+            )
+            payload = {
+                "id": "chatcmpl-loadtest",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {
+                    "prompt_tokens": prompt_chars // 4,
+                    "completion_tokens": len(content) // 4,
+                    "total_tokens": (prompt_chars + len(content)) // 4,
+                    "prompt_tokens_details": {"cached_tokens": 0},
+                },
+            }
+            data = json.dumps(payload).encode("utf-8")
+            content_type = "application/json"
+        elif self.path.endswith("/audio/speech"):
+            time.sleep(self.tts_latency)
+            size = max(1, len(body.get("input", "")) * self.audio_bytes_per_char)
+            data = SILENT_MP3_FRAME * (size // len(SILENT_MP3_FRAME) + 1)
+            content_type = "audio/mpeg"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeOpenAIServer:
+    """Runs FakeOpenAIHandler on a local port in a background thread."""
+    def __init__(self, chat_latency, tts_latency, audio_bytes_per_char):
+        handler = type("ConfiguredFakeOpenAIHandler", (FakeOpenAIHandler,), {
+            "chat_latency": chat_latency,
+            "tts_latency": tts_latency,
+            "audio_bytes_per_char": audio_bytes_per_char,
+        })
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeUploadedFile:
+    """Stands in for Streamlit's UploadedFile (name + getbuffer)."""
+    def __init__(self, name, data):
+        self.name = name
+        self._data = data
+
+    def getbuffer(self):
+        return memoryview(self._data)
+
+
+def current_rss_bytes():
+    """Resident set size of this process (Linux /proc; falls back to peak RSS elsewhere)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemorySampler:
+    """Samples RSS in the background and keeps the peak."""
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (None if empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_session(index, args, work_dir):
+    """
+    Runs one simulated session end to end.
+
+    Returns:
+        dict: Stage latencies in seconds, plus "error" if the session failed.
+    """
+    # Imported here so the environment (fake backend URL, temp dirs) is set first
+    from utils import estimate_run_cost, publish_live_segment
+    from pipeline import PipelineRun, compute_run_id
+    from segments import SegmentPlaylist
+    from artifact_store import artifact_store
+    from admission import admission_controller, user_quotas
+    from audio_formats import DEFAULT_AUDIO_PROFILE
+    from streamlit.testing.v1 import AppTest
+
+    timings = {}
+    session_id = f"loadtest-{index}"
+    session_dir = os.path.join(work_dir, session_id)
+    os.makedirs(session_dir, exist_ok=True)
+    document = SAMPLE_NEWSLETTER + (f"\nIssue marker {index}\n" if args.unique_documents else "")
+    uploaded_files = [FakeUploadedFile(f"newsletter_{index}.txt", document.encode("utf-8"))]
+    user_key = f"loadtest-user-{index}"
+    start = time.perf_counter()
+    ticket = None
+    live_playlist = None
+    try:
+        if args.admission:
+            # Same admission path as the app: a global slot cap with a FIFO queue and load shedding
+            stage_start = time.perf_counter()
+            ticket = admission_controller.submit(user_key)
+            while not admission_controller.wait(ticket, timeout=1):
+                pass
+            timings["queue"] = time.perf_counter() - stage_start
+
+        # Same options and hooks as the "Generate Podcast" handler
+        run_options = {
+            "instructions": "",
+            "length_option": args.length,
+            "voice": "nova",
+            "speed": 1.0,
+            "audio_profile": DEFAULT_AUDIO_PROFILE,
+            "renditions": [],
+        }
+        run_id = compute_run_id(session_id, uploaded_files, run_options)
+        if args.progressive:
+            live_playlist = SegmentPlaylist(os.path.join(work_dir, "live", run_id))
+        stage_starts = []
+        run_result = PipelineRun(run_id, run_options).execute(
+            uploaded_files, session_dir, session_dir,
+            on_stage=lambda stage, resumed: stage_starts.append((stage, time.perf_counter())),
+            on_segment=(lambda i, segment_path, total: publish_live_segment(live_playlist, segment_path)) if live_playlist else None,
+            before_generation=lambda text, stage: user_quotas.reserve(user_key, *estimate_run_cost(text, args.length, stage)),
+        )
+        # Each stage lasts until the next one starts; the last one until the run returns
+        stage_ends = [started for _, started in stage_starts[1:]] + [time.perf_counter()]
+        for (stage, started), ended in zip(stage_starts, stage_ends):
+            timings[stage] = ended - started
+        if ticket:
+            admission_controller.release(ticket)
+            ticket = None
+
+        # Playback: a rerun of the real app with this session's results in state
+        stage_start = time.perf_counter()
+        at = AppTest.from_file(args.app, default_timeout=args.app_timeout)
+        at.session_state["session_id"] = session_id
+        at.session_state["temp_dir_read"] = session_dir
+        at.session_state["run_id"] = run_id
+        at.session_state["audio_full_path"] = run_result["audio_path"]
+        at.session_state["podcast_script_handle"] = artifact_store.put_text(session_id, run_result["script"])
+        at.run()
+        if at.exception:
+            raise RuntimeError(f"App raised during playback: {at.exception[0].message}")
+        timings["playback"] = time.perf_counter() - stage_start
+    except Exception as e:
+        timings["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if live_playlist:
+            live_playlist.finish()
+        if ticket:
+            admission_controller.release(ticket)
+    timings["total"] = time.perf_counter() - start
+    return timings
+
+
+def run_level(concurrency, args, work_dir):
+    """Runs `args.sessions` sessions with `concurrency` of them in flight at once."""
+    with MemorySampler() as memory:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(lambda i: run_session(i, args, work_dir), range(args.sessions)))
+        wall = time.perf_counter() - start
+
+    ok = [r for r in results if "error" not in r]
+    level = {
+        "concurrency": concurrency,
+        "sessions": len(results),
+        "failed": len(results) - len(ok),
+        "errors": sorted({r["error"] for r in results if "error" in r}),
+        "wall_seconds": wall,
+        "throughput_sessions_per_second": len(ok) / wall if wall else 0.0,
+        "peak_rss_mb": memory.peak / (1024 * 1024),
+        "latency_seconds": {},
+    }
+    for stage in STAGES:
+        values = [r[stage] for r in ok if stage in r]
+        level["latency_seconds"][stage] = {
+            "p50": percentile(values, 50),
+            "p90": percentile(values, 90),
+            "p99": percentile(values, 99),
+            "max": max(values) if values else None,
+        }
+    return level
+
+
+def git_revision():
+    """Current commit hash, or None outside a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_seconds(value):
+    return f"{value:8.3f}" if value is not None else "     n/a"
+
+
+def print_report(report, previous=None):
+    """Prints a per-level table, with deltas against a previous report when given."""
+    previous_levels = {level["concurrency"]: level for level in (previous or {}).get("levels", [])}
+    print(f"Inbox.fm load test @ {report['revision'] or 'unknown revision'} ({report['timestamp']})")
+    print(f"{'conc':>4} {'ok/n':>7} {'sess/s':>7} {'rss MB':>8} {'total p50':>9} {'p90':>8} {'p99':>8} {'queue p90':>9} {'script p90':>10} {'synth p90':>9} {'asm p90':>8} {'play p90':>8}")
+    for level in report["levels"]:
+        latency = level["latency_seconds"]
+        print(
+            f"{level['concurrency']:>4} {level['sessions'] - level['failed']:>3}/{level['sessions']:<3} "
+            f"{level['throughput_sessions_per_second']:>7.2f} {level['peak_rss_mb']:>8.1f} "
+            f"{format_seconds(latency['total']['p50'])} {format_seconds(latency['total']['p90'])} {format_seconds(latency['total']['p99'])} "
+            f"{format_seconds(latency['queue']['p90']):>9} {format_seconds(latency['script']['p90']):>10} {format_seconds(latency['synthesize']['p90']):>9} "
+            f"{format_seconds(latency['assemble']['p90'])} {format_seconds(latency['playback']['p90'])}"
+        )
+        for error in level["errors"]:
+            print(f"       error: {error}")
+        before = previous_levels.get(level["concurrency"])
+        if before and before["latency_seconds"]["total"]["p90"] and latency["total"]["p90"]:
+            change = latency["total"]["p90"] / before["latency_seconds"]["total"]["p90"] - 1
+            label = (before.get("revision") or "previous")[:10]
+            print(f"       vs {label}: total p90 {change:+.1%}, "
+                  f"throughput {level['throughput_sessions_per_second'] - before['throughput_sessions_per_second']:+.2f} sess/s, "
+                  f"rss {level['peak_rss_mb'] - before['peak_rss_mb']:+.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Inbox.fm pipeline and app with simulated concurrent sessions.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8], help="Concurrency levels to test.")
+    parser.add_argument("--sessions", type=int, default=8, help="Sessions per concurrency level.")
+    parser.add_argument("--length", default="2 mins", choices=["Auto", "2 mins", "5 mins", "10 mins"])
+    parser.add_argument("--progressive", action="store_true", help="Publish segments to a live playlist as they finish, like progressive playback in the app.")
+    parser.add_argument("--unique-documents", action="store_true", help="Give every session a distinct document (defeats the digest cache).")
+    parser.add_argument("--chat-latency", type=float, default=0.5, help="Fake chat completion latency (s).")
+    parser.add_argument("--tts-latency", type=float, default=0.3, help="Fake TTS latency (s).")
+    parser.add_argument("--audio-bytes-per-char", type=int, default=1000, help="Fake TTS output size per input character.")
+    parser.add_argument("--admission", action="store_true", help="Route sessions through the admission controller (queue + load shedding).")
+    parser.add_argument("--max-concurrent-runs", type=int, default=4, help="Run slots with --admission.")
+    parser.add_argument("--max-queue-wait", type=float, default=300, help="Queue wait limit (s) with --admission.")
+    parser.add_argument("--expected-run-seconds", type=float, default=2, help="Initial run time estimate (s) for queue projections with --admission.")
+    parser.add_argument("--app", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py"))
+    parser.add_argument("--app-timeout", type=float, default=60)
+    parser.add_argument("--report", default="loadtest_report.json", help="Where to write the JSON report.")
+    parser.add_argument("--compare", help="Previous JSON report to compare against.")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's INFO logs.")
+    args = parser.parse_args()
+
+    with FakeOpenAIServer(args.chat_latency, args.tts_latency, args.audio_bytes_per_char) as backend, \
+            tempfile.TemporaryDirectory(prefix="inboxfm_loadtest_") as work_dir:
+        # Point the app at the fake backend and keep caches out of the real deployment dirs
+        os.environ["OPENAI_API_KEY"] = "sk-loadtest"
+        os.environ["OPENAI_BASE_URL"] = backend.base_url
+        os.environ["INBOXFM_DIGEST_CACHE_DIR"] = os.path.join(work_dir, "digest_cache")
+        os.environ["INBOXFM_ARTIFACT_DIR"] = os.path.join(work_dir, "artifacts")
+        os.environ["INBOXFM_RUNS_DIR"] = os.path.join(work_dir, "runs")
+        os.environ["INBOXFM_MAX_CONCURRENT_RUNS"] = str(args.max_concurrent_runs)
+        os.environ["INBOXFM_MAX_QUEUE_WAIT_SECONDS"] = str(args.max_queue_wait)
+        os.environ["INBOXFM_EXPECTED_RUN_SECONDS"] = str(args.expected_run_seconds)
+        sys.path.insert(0, os.path.dirname(os.path.abspath(args.app)))
+
+        import utils # noqa: F401 - configures logging; imported before quieting it
+        if not args.verbose:
+            logging.getLogger().setLevel(logging.WARNING)
+            # AppTest driven from worker threads has no ScriptRunContext, which Streamlit warns about
+            # (a filter, because Streamlit resets its loggers' levels when AppTest loads its config)
+            logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(lambda record: record.levelno >= logging.ERROR)
+
+        report = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("report", "compare", "app")},
+            "levels": [],
+        }
+        for concurrency in args.concurrency:
+            print(f"Running {args.sessions} session(s) at concurrency {concurrency}...", file=sys.stderr)
+            report["levels"].append(run_level(concurrency, args, work_dir))
+
+    previous = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        for level in previous.get("levels", []):
+            level.setdefault("revision", previous.get("revision"))
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print_report(report, previous)
+    print(f"Report written to {args.report}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import time
+import random
+import logging
+import threading
+from collections import deque
+
+import openai
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+QUALITY_MODEL = "gpt-4o"
+FAST_MODEL = "gpt-4o-mini"
+
+# Episodes up to this many words (the "2 mins" option) are written by the fast model.
+FAST_MODEL_MAX_WORDS = 300
+# Inputs larger than this (estimated tokens) go to the quality model, which handles long context better.
+FAST_MODEL_MAX_INPUT_TOKENS = 12000
+
+# Per-request timeout (seconds) before falling back to the next model.
+MODEL_TIMEOUTS = {
+    QUALITY_MODEL: 90,
+    FAST_MODEL: 45,
+}
+DEFAULT_TIMEOUT = 60
+# Client-side retries for routed calls. The SDK would otherwise retry timeouts, 429s
+# and 5xx itself (up to 3x the timeout) before the router could fall back; the router
+# retries rate limits itself (see RATE_LIMIT_RETRIES).
+ROUTED_MAX_RETRIES = 0
+# Rate limits (429) are usually transient, so a rate-limited model is retried with
+# backoff before the router moves on (or gives up on the last model). The server's
+# retry-after is honoured; a model that asks for a longer wait than
+# RATE_LIMIT_MAX_DELAY is skipped right away.
+RATE_LIMIT_RETRIES = 2
+RATE_LIMIT_BASE_DELAY = 1.0
+RATE_LIMIT_MAX_DELAY = 20.0
+
+# Rolling health window per model.
+HEALTH_WINDOW = 20
+# Minimum observations before health can demote a model.
+HEALTH_MIN_SAMPLES = 3
+# A model whose recent error rate exceeds this is tried after its alternative.
+MAX_ERROR_RATE = 0.5
+# A model whose recent median latency exceeds its timeout by this factor is also demoted.
+SLOW_LATENCY_FACTOR = 0.8
+
+# Errors that mean "try another model" rather than "the request itself is bad".
+FALLBACK_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    TimeoutError,
+    ConnectionError, # Raised by non-OpenAI providers for unreachable/overloaded backends
+)
+
+def estimate_tokens(text_or_chars):
+    """Rough token estimate (~4 characters per token) for a string or a character count."""
+    chars = text_or_chars if isinstance(text_or_chars, int) else len(text_or_chars or "")
+    return chars // 4
+
+def retry_after_seconds(error):
+    """The wait a rate-limit response asks for (retry-after-ms / retry-after headers), or None."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass # An HTTP date; use the backoff schedule instead
+    return None
+
+def rate_limit_delay(error, attempt):
+    """
+    Seconds to wait before retrying a rate-limited call, or None to stop retrying.
+
+    Args:
+        error (openai.RateLimitError): The rate-limit error.
+        attempt (int): Retries already made for this model.
+    """
+    if attempt >= RATE_LIMIT_RETRIES or getattr(error, "code", None) == "insufficient_quota":
+        # Out of retries, or out of credit, which no wait will fix
+        return None
+    delay = retry_after_seconds(error)
+    if delay is None:
+        # Exponential backoff with jitter, so sessions rate-limited together do not retry together
+        delay = RATE_LIMIT_BASE_DELAY * 2 ** attempt * random.uniform(0.5, 1.0)
+    return delay if delay <= RATE_LIMIT_MAX_DELAY else None
+
+
+class ModelRouter:
+    """
+    Picks a chat model per request from input size, requested length and the
+    recently observed latency/error rate of each model, and falls back to the
+    alternative model on timeouts, connection errors and overload. Rate limits
+    are retried on the same model first (see rate_limit_delay).
+
+    One router is shared by all sessions in the process so health observations
+    from every request inform the next routing decision.
+    """
+    def __init__(self, quality_model=QUALITY_MODEL, fast_model=FAST_MODEL, window=HEALTH_WINDOW):
+        self.quality_model = quality_model
+        self.fast_model = fast_model
+        self._history = {}
+        self._window = window
+        self._lock = threading.Lock()
+
+    def record(self, model, latency, ok):
+        """Adds one observation (latency in seconds, success flag) to the model's rolling window."""
+        with self._lock:
+            history = self._history.setdefault(model, deque(maxlen=self._window))
+            history.append((latency, ok))
+
+    def health(self, model):
+        """
+        Summarizes the rolling window for `model`.
+
+        Returns:
+            dict: samples, error_rate and median_latency (successful calls only; None if unknown).
+        """
+        with self._lock:
+            history = list(self._history.get(model, ()))
+        if not history:
+            return {"samples": 0, "error_rate": 0.0, "median_latency": None}
+        latencies = sorted(latency for latency, ok in history if ok)
+        return {
+            "samples": len(history),
+            "error_rate": sum(1 for _, ok in history if not ok) / len(history),
+            "median_latency": latencies[len(latencies) // 2] if latencies else None,
+        }
+
+    def is_degraded(self, model):
+        """True if recent observations show the model erroring or running close to its timeout."""
+        stats = self.health(model)
+        if stats["samples"] < HEALTH_MIN_SAMPLES:
+            return False
+        if stats["error_rate"] > MAX_ERROR_RATE:
+            return True
+        timeout = MODEL_TIMEOUTS.get(model, DEFAULT_TIMEOUT)
+        return stats["median_latency"] is not None and stats["median_latency"] > timeout * SLOW_LATENCY_FACTOR
+
+    def choose(self, input_chars, target_words=None):
+        """
+        Orders the candidate models for a request.
+
+        Args:
+            input_chars (int): Size of the prompt content in characters.
+            target_words (int, optional): Requested script length; None for "Auto".
+
+        Returns:
+            tuple: (models, reason) where models is the ordered list to try.
+        """
+        input_tokens = estimate_tokens(input_chars)
+        if input_tokens > FAST_MODEL_MAX_INPUT_TOKENS:
+            models, reason = [self.quality_model, self.fast_model], f"large input (~{input_tokens} tokens)"
+        elif target_words is not None and target_words <= FAST_MODEL_MAX_WORDS:
+            models, reason = [self.fast_model, self.quality_model], f"short episode ({target_words} words)"
+        else:
+            models, reason = [self.quality_model, self.fast_model], "default quality model"
+
+        if self.is_degraded(models[0]) and not self.is_degraded(models[1]):
+            reason += f"; {models[0]} degraded ({self.health(models[0])}), preferring {models[1]}"
+            models.reverse()
+        return models, reason
+
+    def run(self, call_fn, input_chars, target_words=None, task="text", models=None):
+        """
+        Executes `call_fn` against the routed models until one succeeds.
+
+        Args:
+            call_fn (callable): Called as `call_fn(model, timeout)`; returns the result.
+                It should not retry on its own (see ROUTED_MAX_RETRIES).
+            input_chars (int): Size of the prompt content in characters.
+            target_words (int, optional): Requested output length in words.
+            task (str): Label used in routing logs.
+            models (list, optional): Explicit candidate order, bypassing `choose`.
+
+        Returns:
+            The first successful result of `call_fn`.
+
+        Raises:
+            Exception: The last fallback-worthy error if every model failed, or
+                immediately any error that is not fallback-worthy.
+        """
+        if models is None:
+            models, reason = self.choose(input_chars, target_words)
+        else:
+            reason = "explicit model order"
+        logging.info(f"Model routing [{task}]: trying {' -> '.join(models)} (input ~{estimate_tokens(input_chars)} tokens, target {target_words or 'auto'} words; {reason})")
+
+        last_error = None
+        for model in models:
+            timeout = MODEL_TIMEOUTS.get(model, DEFAULT_TIMEOUT)
+            start = time.perf_counter()
+            try:
+                result, latency = self._call(call_fn, model, timeout, task)
+            except FALLBACK_ERRORS as e:
+                self.record(model, time.perf_counter() - start, ok=False)
+                logging.warning(f"Model routing [{task}]: {model} failed ({type(e).__name__}: {e}); falling back.")
+                last_error = e
+                continue
+            self.record(model, latency, ok=True)
+            logging.info(f"Model routing [{task}]: served by {model} in {latency:.2f}s.")
+            return result
+        raise last_error
+
+    def _call(self, call_fn, model, timeout, task):
+        """Calls one model, retrying rate limits; returns (result, latency of the successful call)."""
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                return call_fn(model, timeout), time.perf_counter() - start
+            except openai.RateLimitError as e:
+                delay = rate_limit_delay(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                logging.warning(f"Model routing [{task}]: {model} rate limited; retrying in {delay:.1f}s ({attempt}/{RATE_LIMIT_RETRIES}).")
+                time.sleep(delay)
@@ -0,0 +1,214 @@
+import os
+import re
+import shutil
+import hashlib
+import logging
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Recognized page text is cached by page content, so re-uploading a scanned issue is free.
+OCR_CACHE_DIR = os.getenv("INBOXFM_OCR_CACHE_DIR", "ocr_cache")
+# Maximum pages OCRed per document (cached pages do not count). Bounds the time a
+# fully scanned document can take; later text-less pages are skipped.
+OCR_PAGE_BUDGET = int(os.getenv("INBOXFM_OCR_PAGE_BUDGET", "20"))
+# Pages rasterized and recognized concurrently across the whole server (all runs
+# share one pool). Each tesseract is limited to one thread, so this is also the
+# number of cores OCR can occupy.
+OCR_WORKERS = int(os.getenv("INBOXFM_OCR_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Per-page limit for rasterizing and recognizing, in seconds.
+OCR_PAGE_TIMEOUT = int(os.getenv("INBOXFM_OCR_PAGE_TIMEOUT", "60"))
+OCR_LANGUAGE = os.getenv("INBOXFM_OCR_LANGUAGE", "eng")
+OCR_DPI = 300
+
+# Pages whose extracted text is shorter than this are treated as image-only.
+MIN_PAGE_TEXT_CHARS = 20
+
+# Page entries that determine how a page renders. /Parent (the page tree) is left out.
+FINGERPRINT_PAGE_KEYS = ("/Contents", "/Resources", "/MediaBox", "/CropBox", "/Rotate", "/UserUnit")
+# Back-references that would pull unrelated parts of the document into the hash.
+FINGERPRINT_SKIP_KEYS = {"/Parent", "/P"}
+
+# The workers only wait on pdftoppm/tesseract subprocesses, so threads are enough.
+ocr_executor = ThreadPoolExecutor(max_workers=max(1, OCR_WORKERS), thread_name_prefix="ocr")
+# tesseract's OpenMP threads would otherwise multiply with OCR_WORKERS.
+TESSERACT_ENV = {**os.environ, "OMP_THREAD_LIMIT": "1"}
+
+def ocr_available():
+    """True if poppler's pdftoppm and tesseract are installed."""
+    return shutil.which("pdftoppm") is not None and shutil.which("tesseract") is not None
+
+def needs_ocr(page_text):
+    """True if a page's extracted text is empty or too short to be real content."""
+    return len((page_text or "").strip()) < MIN_PAGE_TEXT_CHARS
+
+def _hash_pdf_object(obj, digest, seen):
+    """Feeds a PDF object into `digest`, following references and stream data recursively."""
+    if isinstance(obj, IndirectObject):
+        ref = (obj.idnum, obj.generation)
+        if ref in seen:
+            digest.update(f"<ref {ref[0]} {ref[1]}>".encode("ascii"))
+            return
+        seen.add(ref)
+        obj = obj.get_object()
+    if isinstance(obj, DictionaryObject):
+        digest.update(b"<<")
+        for key in sorted(obj):
+            if key in FINGERPRINT_SKIP_KEYS or key == "/Length":
+                continue
+            digest.update(str(key).encode("utf-8"))
+            _hash_pdf_object(obj.get(key), digest, seen)
+        digest.update(b">>")
+        if isinstance(obj, StreamObject):
+            # Decoded content: image pixels, form XObject drawing operators, soft masks, ...
+            digest.update(obj.get_data())
+    elif isinstance(obj, ArrayObject):
+        digest.update(b"[")
+        for item in obj:
+            _hash_pdf_object(item, digest, seen)
+        digest.update(b"]")
+    else:
+        digest.update(repr(obj).encode("utf-8"))
+
+def page_fingerprint(page):
+    """
+    Returns a SHA-256 hex digest of everything that determines how a PyPDF2 page renders.
+
+    The content streams, page geometry and the whole resource tree are hashed
+    recursively, including Form XObjects, the images they draw, masks and fonts.
+    Identical scanned pages in different files (or re-uploads) share a
+    fingerprint, which keys the OCR cache together with the OCR language and
+    resolution; any visible difference changes it.
+
+    Args:
+        page (PyPDF2.PageObject): The page.
+
+    Returns:
+        str: 64-character hex digest, or None if the page could not be hashed
+            (its OCR result is then not cached).
+    """
+    digest = hashlib.sha256()
+    seen = set()
+    try:
+        for key in FINGERPRINT_PAGE_KEYS:
+            digest.update(key.encode("ascii"))
+            _hash_pdf_object(page.get(key), digest, seen)
+        return digest.hexdigest()
+    except Exception as e:
+        logging.warning(f"Could not fingerprint PDF page for the OCR cache: {e}")
+        return None
+
+def _cache_path(fingerprint, cache_dir, language, dpi):
+    # The same page read with another language or resolution is a different result
+    language = re.sub(r"[^A-Za-z0-9_+-]", "_", language)
+    return os.path.join(cache_dir, f"{fingerprint}.{language}.{dpi}dpi.txt")
+
+def _read_cached(fingerprint, cache_dir, language, dpi):
+    if not fingerprint:
+        return None
+    try:
+        with open(_cache_path(fingerprint, cache_dir, language, dpi), 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def _write_cached(fingerprint, text, cache_dir, language, dpi):
+    if not fingerprint:
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _cache_path(fingerprint, cache_dir, language, dpi)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def ocr_page(pdf_path, page_index, dpi=OCR_DPI, language=OCR_LANGUAGE, timeout=OCR_PAGE_TIMEOUT):
+    """
+    Rasterizes a single PDF page and recognizes its text (runs on an OCR worker thread).
+
+    Args:
+        pdf_path (str): Path to the PDF.
+        page_index (int): Zero-based page index.
+        dpi (int): Rasterization resolution.
+        language (str): Tesseract language code(s), e.g. "eng" or "eng+deu".
+        timeout (int): Seconds allowed for each external tool.
+
+    Returns:
+        str: The recognized text.
+
+    Raises:
+        RuntimeError: If pdftoppm or tesseract fails.
+        subprocess.TimeoutExpired: If either tool exceeds `timeout`.
+    """
+    page_number = page_index + 1
+    with tempfile.TemporaryDirectory() as work_dir:
+        prefix = os.path.join(work_dir, "page")
+        result = subprocess.run(
+            ["pdftoppm", "-f", str(page_number), "-l", str(page_number), "-r", str(dpi), "-gray", "-png", "-singlefile", pdf_path, prefix],
+            capture_output=True, text=True, timeout=timeout
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"pdftoppm failed on page {page_number}: {result.stderr.strip()}")
+        result = subprocess.run(
+            ["tesseract", f"{prefix}.png", "stdout", "-l", language],
+            capture_output=True, text=True, timeout=timeout, env=TESSERACT_ENV
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"tesseract failed on page {page_number}: {result.stderr.strip()}")
+        return result.stdout
+
+def ocr_pdf_pages(pdf_path, pages, page_budget=OCR_PAGE_BUDGET, cache_dir=OCR_CACHE_DIR, language=OCR_LANGUAGE, dpi=OCR_DPI):
+    """
+    OCRs the given pages of a PDF in parallel, using cached text where available.
+
+    Pages run on the shared ocr_executor, so concurrent runs together never
+    OCR more than OCR_WORKERS pages at once.
+
+    Args:
+        pdf_path (str): Path to the PDF.
+        pages (dict): Zero-based page index -> page fingerprint (may be None)
+            for every page that needs OCR.
+        page_budget (int): Maximum number of uncached pages to OCR.
+        cache_dir (str): Directory of the page text cache.
+        language (str): Tesseract language code(s).
+        dpi (int): Rasterization resolution.
+
+    Returns:
+        dict: Page index -> recognized text, for the pages that were recognized.
+            Pages over budget or that failed are missing.
+    """
+    texts = {}
+    pending = []
+    for index in sorted(pages):
+        cached = _read_cached(pages[index], cache_dir, language, dpi)
+        if cached is not None:
+            texts[index] = cached
+        else:
+            pending.append(index)
+
+    if len(pending) > page_budget:
+        logging.warning(f"{pdf_path}: {len(pending)} pages need OCR; only the first {page_budget} are processed (INBOXFM_OCR_PAGE_BUDGET).")
+        pending = pending[:page_budget]
+    if not pending:
+        return texts
+    if not ocr_available():
+        logging.warning(f"{pdf_path}: {len(pending)} image-only pages skipped; install tesseract and poppler (pdftoppm) to read them.")
+        return texts
+
+    logging.info(f"{pdf_path}: OCR of {len(pending)} pages ({len(texts)} cached) on {OCR_WORKERS} shared workers.")
+    futures = {ocr_executor.submit(ocr_page, pdf_path, index, dpi, language): index for index in pending}
+    for future in as_completed(futures):
+        index = futures[future]
+        try:
+            text = future.result()
+        except Exception as e:
+            logging.error(f"{pdf_path}: OCR failed for page {index + 1}: {e}")
+            continue
+        texts[index] = text
+        _write_cached(pages[index], text, cache_dir, language, dpi)
+    return texts
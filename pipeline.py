@@ -0,0 +1,402 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+from utils import (
+    read_uploaded_files, generate_podcast_script, synthesize_podcast_segments, assemble_podcast_audio,
+    carry_over_unchanged_segments,
+)
+from audio_formats import rendition_path
+from artifact_store import SESSION_IDLE_SECONDS, EVICTION_INTERVAL_SECONDS
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Where run checkpoints (manifest + stage outputs) are kept.
+RUNS_DIR = os.getenv("INBOXFM_RUNS_DIR", "runs")
+# Run directories untouched for this long are deleted. Matches the artifact store's
+# session idle time: once a session is evicted its runs can no longer be resumed or edited.
+RUN_IDLE_SECONDS = int(os.getenv("INBOXFM_RUN_IDLE_SECONDS", str(SESSION_IDLE_SECONDS)))
+
+# Live playlists (see segments.SegmentPlaylist) of runs being generated, one directory per
+# run. Streamlit serves them from the app's static/ folder under LIVE_URL_PATH (see
+# .streamlit/config.toml), so they are kept apart from RUNS_DIR, which holds private text.
+LIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "live")
+LIVE_URL_PATH = "app/static/live"
+
+_last_sweep = 0.0
+_sweep_lock = threading.Lock()
+
+STAGES = ["extract", "script", "synthesize", "assemble"]
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class NoContentError(ValueError):
+    """Raised by the extract stage when none of the uploaded files yielded text."""
+
+
+def compute_run_id(session_id, uploaded_files, options, runs_dir=RUNS_DIR):
+    """
+    Derives a deterministic run ID from the session, the uploaded file contents
+    and the generation options, so retrying a failed or interrupted request
+    finds the same run. Completed runs are never reused: once the run for an
+    attempt is complete, the same request gets the ID of the next attempt, so
+    generating again produces a fresh script.
+
+    Args:
+        session_id (str): Streamlit session ID (keeps runs private to a session).
+        uploaded_files (list): Streamlit UploadedFile objects.
+        options (dict): JSON-serializable generation options.
+        runs_dir (str): Where run checkpoints are kept.
+
+    Returns:
+        str: 16-character hex run ID.
+    """
+    digest = hashlib.sha256()
+    digest.update(session_id.encode("utf-8"))
+    for uploaded_file in uploaded_files:
+        digest.update(uploaded_file.name.encode("utf-8"))
+        digest.update(hashlib.sha256(uploaded_file.getbuffer()).digest())
+    digest.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+    run_id = digest.hexdigest()[:16]
+    attempt = 0
+    while run_completed(run_id, runs_dir):
+        attempt += 1
+        salted = digest.copy()
+        salted.update(f"attempt:{attempt}".encode("utf-8"))
+        run_id = salted.hexdigest()[:16]
+    return run_id
+
+def run_completed(run_id, runs_dir=RUNS_DIR):
+    """True if every stage of the run is done (according to its manifest)."""
+    try:
+        with open(os.path.join(runs_dir, run_id, "manifest.json"), 'r', encoding='utf-8') as f:
+            stages = json.load(f).get("stages", {})
+    except (OSError, ValueError):
+        return False
+    return all(stages.get(stage, {}).get("status") == DONE for stage in STAGES)
+
+
+def touch_run(run_id, runs_dir=RUNS_DIR, live_dir=LIVE_DIR):
+    """Marks a run as in use (its session is still active), postponing its deletion."""
+    for run_dir in (os.path.join(runs_dir, run_id), os.path.join(live_dir, run_id)):
+        if os.path.isdir(run_dir):
+            os.utime(run_dir)
+
+def sweep_idle_runs(idle_seconds=RUN_IDLE_SECONDS, runs_dir=RUNS_DIR, force=False, live_dir=LIVE_DIR):
+    """
+    Deletes run directories (and live playlists) that have not been touched for
+    `idle_seconds`. Runs at most once per EVICTION_INTERVAL_SECONDS unless
+    `force` is set.
+
+    Returns:
+        list: IDs of the deleted runs.
+    """
+    global _last_sweep
+    now = time.time()
+    with _sweep_lock:
+        if not force and now - _last_sweep < EVICTION_INTERVAL_SECONDS:
+            return []
+        _last_sweep = now
+    removed = []
+    for parent_dir in (runs_dir, live_dir):
+        if not os.path.isdir(parent_dir):
+            continue
+        for run_id in os.listdir(parent_dir):
+            run_dir = os.path.join(parent_dir, run_id)
+            if not os.path.isdir(run_dir):
+                continue
+            manifest_path = os.path.join(run_dir, "manifest.json")
+            last_used = max(os.path.getmtime(path) for path in (run_dir, manifest_path) if os.path.exists(path))
+            if now - last_used > idle_seconds:
+                shutil.rmtree(run_dir, ignore_errors=True)
+                if parent_dir == runs_dir:
+                    removed.append(run_id)
+    if removed:
+        logging.info(f"Deleted {len(removed)} idle run(s) from {runs_dir}.")
+    return removed
+
+
+class PipelineRun:
+    """
+    A podcast generation run modeled as explicit, checkpointed stages:
+
+        extract -> script -> synthesize -> assemble
+
+    Each stage's output and status are persisted under RUNS_DIR/<run_id>/ (a
+    manifest.json plus stage files). Executing a run skips every stage already
+    marked done whose output is still present, so a retry after a failure resumes
+    from the first incomplete stage (as long as the run is not swept as idle, see
+    sweep_idle_runs). Synthesis also keeps individual segments,
+    so a failure halfway through TTS only re-synthesizes the missing segments.
+
+    A finished run's script can be edited with revise_script, which reuses the
+    same segment checkpoints to rebuild only the changed paragraphs.
+    """
+    def __init__(self, run_id, options=None, runs_dir=RUNS_DIR):
+        self.run_id = run_id
+        self.options = options
+        self.run_dir = os.path.join(runs_dir, run_id)
+        self.manifest_path = os.path.join(self.run_dir, "manifest.json")
+        self._lock = threading.Lock()
+        os.makedirs(self.run_dir, exist_ok=True)
+        self.manifest = self._load_manifest()
+        if self.options is None:
+            # Reopening an existing run (e.g. to edit its script)
+            self.options = self.manifest.get("options", {})
+
+    # --- Manifest ---
+
+    def _load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Ignoring unreadable manifest for run {self.run_id}: {e}")
+        return {
+            "run_id": self.run_id,
+            "created_at": time.time(),
+            "options": self.options,
+            "stages": {stage: {"status": PENDING} for stage in STAGES},
+        }
+
+    def _save_manifest(self):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _set_stage(self, stage, status, **fields):
+        with self._lock:
+            entry = {"status": status, "updated_at": time.time(), **fields}
+            if status != DONE:
+                # Keep earlier outputs visible for debugging, but never trust them
+                entry = {**self.manifest["stages"].get(stage, {}), **entry}
+            self.manifest["stages"][stage] = entry
+            self._save_manifest()
+
+    def stage(self, stage):
+        """Returns the manifest entry (status, outputs, error) for a stage."""
+        return self.manifest["stages"].get(stage, {"status": PENDING})
+
+    def _path(self, name):
+        return os.path.join(self.run_dir, name)
+
+    def _read_text(self, name):
+        with open(self._path(name), 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def _write_text(self, name, text):
+        tmp_path = self._path(f"{name}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, self._path(name))
+
+    def _is_done(self, stage, required_paths=()):
+        """True if the stage is marked done and all its outputs still exist."""
+        return self.stage(stage).get("status") == DONE and all(os.path.exists(path) for path in required_paths)
+
+    def first_incomplete_stage(self):
+        """Name of the first stage that still has to run, or None if the run is complete."""
+        for stage in STAGES:
+            if self.stage(stage).get("status") != DONE:
+                return stage
+        return None
+
+    # --- Execution ---
+
+    def execute(self, uploaded_files, temp_dir, output_dir, on_stage=None, on_segment=None, before_generation=None):
+        """
+        Runs (or resumes) the pipeline.
+
+        Args:
+            uploaded_files (list): Streamlit UploadedFile objects.
+            temp_dir (str): Scratch directory for reading uploads.
+            output_dir (str): Directory for the finished episode (AUDIO_DIR).
+            on_stage (callable, optional): Called as `on_stage(stage, resumed)`
+                when a stage starts (`resumed` False) or is skipped because its
+                checkpoint is reused (`resumed` True).
+            on_segment (callable, optional): Passed to synthesis for progressive playback.
+            before_generation (callable, optional): Called as
+                `before_generation(combined_text, from_stage)` after extraction and
+                before the first API-backed stage that still has to run (e.g. to
+                enforce quotas). Raising aborts the run with nothing spent.
+
+        Returns:
+            dict: combined_text, read_files, failed_files, script, segment_paths,
+                audio_path, rendition_paths.
+
+        Raises:
+            NoContentError: If no text could be extracted.
+            Exception: Any stage failure; the stage is marked failed and earlier
+                stages stay done for the next attempt.
+        """
+        options = self.options
+        result = {}
+        resume_from = self.first_incomplete_stage()
+        if resume_from and resume_from != STAGES[0]:
+            logging.info(f"Resuming run {self.run_id} from stage '{resume_from}'.")
+
+        # 1. Extract
+        if self._is_done("extract", [self._path("extract.txt")]):
+            self._notify(on_stage, "extract", True)
+            result["combined_text"] = self._read_text("extract.txt")
+            result["read_files"] = self.stage("extract").get("read_files", [])
+            result["failed_files"] = self.stage("extract").get("failed_files", [])
+        else:
+            with self._running("extract", on_stage):
+                combined_text, read_files, failed_files = read_uploaded_files(uploaded_files, temp_dir)
+                result.update(combined_text=combined_text, read_files=read_files, failed_files=failed_files)
+                if not combined_text:
+                    self._set_stage("extract", FAILED, read_files=read_files, failed_files=failed_files, error="No content extracted.")
+                    raise NoContentError("Could not read any content from the uploaded files. Please check the file formats and content.")
+                self._write_text("extract.txt", combined_text)
+                self._set_stage("extract", DONE, read_files=read_files, failed_files=failed_files)
+
+        next_stage = self.first_incomplete_stage()
+        if before_generation and next_stage:
+            before_generation(result["combined_text"], next_stage)
+
+        # 2. Script
+        if self._is_done("script", [self._path("script.txt")]):
+            self._notify(on_stage, "script", True)
+            result["script"] = self._read_text("script.txt")
+        else:
+            with self._running("script", on_stage):
+                script = generate_podcast_script(result["combined_text"], options.get("instructions"), options.get("length_option", "Auto"))
+                if not script:
+                    raise RuntimeError("Script generation returned no content.")
+                self._write_text("script.txt", script)
+                self._set_stage("script", DONE)
+                result["script"] = script
+
+        result.update(self._synthesize_and_assemble(result["script"], output_dir, on_stage, on_segment))
+        return result
+
+    def revise_script(self, script_text, output_dir, on_stage=None, on_segment=None, before_synthesis=None):
+        """
+        Replaces the script of a completed run and rebuilds the audio incrementally.
+
+        The edited script is diffed against the current one paragraph by
+        paragraph; only new or changed paragraphs are re-synthesized and the
+        episode is re-assembled from the existing and new segments.
+
+        Args:
+            script_text (str): The edited script.
+            output_dir (str): Directory for the finished episode (AUDIO_DIR).
+            on_stage (callable, optional): See execute.
+            on_segment (callable, optional): See execute.
+            before_synthesis (callable, optional): Called as
+                `before_synthesis(changed_chars)` with the characters that still
+                have to go to TTS, before the script is replaced (e.g. to enforce
+                quotas). Raising aborts the edit with nothing spent.
+
+        Returns:
+            dict: script, audio_path, rendition_paths, reused_segments, total_segments.
+
+        Raises:
+            ValueError: If the edited script is empty.
+            RuntimeError: If the run has no completed script and audio to revise.
+        """
+        if not script_text or not script_text.strip():
+            raise ValueError("The script cannot be empty.")
+        segment_dir = self._path("segments")
+        previous_segments = [os.path.join(segment_dir, name) for name in self.stage("synthesize").get("segments", [])]
+        if not (self._is_done("script", [self._path("script.txt")]) and self._is_done("synthesize", previous_segments)):
+            raise RuntimeError("This episode has no finished audio to update; generate it again instead.")
+
+        previous_script = self._read_text("script.txt")
+        reused, total, changed_chars = carry_over_unchanged_segments(
+            previous_script, previous_segments, script_text, segment_dir,
+            audio_profile=self.options.get("audio_profile"), renditions=self.options.get("renditions"),
+        )
+        if before_synthesis:
+            before_synthesis(changed_chars)
+        with self._running("script", on_stage):
+            self._write_text("script.txt", script_text)
+            self._set_stage("script", DONE, edited=True)
+
+        result = self._synthesize_and_assemble(script_text, output_dir, on_stage, on_segment)
+        # Segment files of the replaced paragraphs are no longer referenced
+        keep = {os.path.basename(path) for path in result["segment_paths"]}
+        for path in previous_segments:
+            if os.path.basename(path) not in keep and os.path.exists(path):
+                os.remove(path)
+        result.update(script=script_text, reused_segments=reused, total_segments=total)
+        return result
+
+    def _synthesize_and_assemble(self, script, output_dir, on_stage, on_segment):
+        options = self.options
+
+        # 3. Synthesize (segment-level checkpoints inside the stage)
+        segment_dir = self._path("segments")
+        done_segments = [os.path.join(segment_dir, name) for name in self.stage("synthesize").get("segments", [])]
+        if self._is_done("synthesize", done_segments):
+            self._notify(on_stage, "synthesize", True)
+            segment_paths = done_segments
+        else:
+            with self._running("synthesize", on_stage):
+                segment_paths = synthesize_podcast_segments(
+                    script, segment_dir,
+                    voice_name=options.get("voice", "nova"),
+                    speed=options.get("speed", 1.0),
+                    audio_profile=options.get("audio_profile"),
+                    on_segment=on_segment,
+                    reuse_existing=True,
+                    renditions=options.get("renditions"),
+                )
+                self._set_stage("synthesize", DONE, segments=[os.path.basename(path) for path in segment_paths])
+
+        # 4. Assemble
+        audio_path = self.stage("assemble").get("audio_path")
+        if audio_path and self._is_done("assemble", [audio_path]):
+            self._notify(on_stage, "assemble", True)
+        else:
+            with self._running("assemble", on_stage):
+                audio_path = assemble_podcast_audio(
+                    segment_paths, output_dir,
+                    filename=f"inboxfm_podcast_{self.run_id}",
+                    audio_profile=options.get("audio_profile"),
+                    renditions=options.get("renditions"),
+                )
+                self._set_stage("assemble", DONE, audio_path=audio_path)
+
+        return {
+            "segment_paths": segment_paths,
+            "audio_path": audio_path,
+            "rendition_paths": [
+                path for path in (rendition_path(audio_path, name) for name in options.get("renditions") or [])
+                if os.path.exists(path)
+            ],
+        }
+
+    def _notify(self, on_stage, stage, resumed):
+        if resumed:
+            logging.info(f"Run {self.run_id}: reusing checkpoint for stage '{stage}'.")
+        if on_stage:
+            on_stage(stage, resumed)
+
+    @contextmanager
+    def _running(self, stage, on_stage):
+        """Marks a stage running (invalidating every later stage), then failed if it raises."""
+        self._notify(on_stage, stage, False)
+        for later in STAGES[STAGES.index(stage) + 1:]:
+            if self.stage(later).get("status") != PENDING:
+                self._set_stage(later, PENDING)
+        self._set_stage(stage, RUNNING)
+        try:
+            yield
+        except Exception as e:
+            if self.stage(stage).get("status") != FAILED:
+                self._set_stage(stage, FAILED, error=f"{type(e).__name__}: {e}")
+            raise
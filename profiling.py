@@ -0,0 +1,204 @@
+import os
+import sys
+import hmac
+import time
+import zlib
+import logging
+import threading
+from collections import Counter
+from html import escape
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Set to 1/true to profile every generation run in this process.
+PROFILE_ENV_VAR = "INBOXFM_PROFILE"
+# When set, a run can also be profiled on demand by opening the app with ?profile=<token>.
+PROFILE_TOKEN_ENV_VAR = "INBOXFM_PROFILE_TOKEN"
+PROFILE_QUERY_PARAM = "profile"
+
+# Sampling interval in seconds (200 Hz).
+SAMPLE_INTERVAL = 0.005
+
+FLAME_WIDTH = 1200
+FLAME_FRAME_HEIGHT = 16
+FLAME_MIN_LABEL_WIDTH = 40
+
+def profiling_enabled(query_params=None):
+    """
+    Decides whether the current generation run should be profiled.
+
+    Args:
+        query_params (mapping, optional): The page's URL query parameters
+            (e.g. st.query_params).
+
+    Returns:
+        bool: True if INBOXFM_PROFILE is on, or the URL carries the admin token.
+    """
+    if os.getenv(PROFILE_ENV_VAR, "").strip().lower() in ("1", "true", "yes", "on"):
+        return True
+    token = os.getenv(PROFILE_TOKEN_ENV_VAR)
+    if token and query_params:
+        supplied = query_params.get(PROFILE_QUERY_PARAM)
+        return bool(supplied) and hmac.compare_digest(str(supplied), token)
+    return False
+
+def worker_thread_prefix(kind):
+    """
+    Thread name prefix for worker pools started by the calling thread, e.g.
+    ThreadPoolExecutor(thread_name_prefix=worker_thread_prefix("tts")).
+
+    The prefix carries the creating thread's ident, which is how a RunProfiler
+    tells its run's workers apart from other sessions' workers.
+    """
+    return f"inboxfm-{kind}-{threading.get_ident()}"
+
+def _is_worker_of(thread_name, target_ident):
+    # ThreadPoolExecutor names its threads "<prefix>_<n>"
+    return thread_name.startswith("inboxfm-") and f"-{target_ident}_" in thread_name
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class RunProfiler:
+    """
+    Low-overhead sampling profiler for one generation run.
+
+    A background thread periodically captures the Python stacks of the thread
+    that started the profiler and of the worker threads it spawns, which are
+    recognized by their worker_thread_prefix name (e.g. TTS segment workers).
+    Threads of other sessions, and untagged threads, are never sampled. Work
+    done in subprocesses (tesseract, ffmpeg) or on the shared OCR pool shows
+    up only as the waiting caller. Samples are aggregated as folded stacks,
+    which are written next to the episode together with a rendered flame
+    graph (SVG).
+
+    Usage:
+        profiler = RunProfiler(output_dir, "inboxfm_podcast_<id>").start()
+        ...
+        folded_path, svg_path = profiler.stop()
+    """
+    def __init__(self, output_dir, stem, interval=SAMPLE_INTERVAL):
+        self.output_dir = output_dir
+        self.stem = stem
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._target_ident = None
+        self._started_at = None
+
+    def start(self):
+        """Starts sampling the calling thread (and threads it spawns)."""
+        self._target_ident = threading.get_ident()
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample_loop, name="inboxfm-profiler", daemon=True)
+        self._thread.start()
+        logging.info(f"Profiling run '{self.stem}' (sampling every {self.interval * 1000:.0f} ms)")
+        return self
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != self._target_ident and not _is_worker_of(names.get(ident, ""), self._target_ident):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        """
+        Stops sampling and writes '<stem>.profile.folded' and '<stem>.flame.svg'.
+
+        Returns:
+            tuple: (folded_path, svg_path)
+        """
+        self._stop.set()
+        self._thread.join()
+        elapsed = time.perf_counter() - self._started_at
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        folded_path = os.path.join(self.output_dir, f"{self.stem}.profile.folded")
+        with open(folded_path, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+        svg_path = os.path.join(self.output_dir, f"{self.stem}.flame.svg")
+        with open(svg_path, 'w', encoding='utf-8') as f:
+            f.write(render_flame_graph(self.samples, title=f"Inbox.fm run {self.stem} ({elapsed:.1f}s, {sum(self.samples.values())} samples)"))
+
+        logging.info(f"Profile saved: {folded_path}, flame graph: {svg_path}")
+        return folded_path, svg_path
+
+def _build_tree(samples):
+    """Turns folded stacks into a nested {name: [count, children]} tree."""
+    root = [0, {}]
+    for stack, count in samples.items():
+        root[0] += count
+        node = root
+        for name in stack.split(";"):
+            node = node[1].setdefault(name, [0, {}])
+            node[0] += count
+    return root
+
+def _frame_color(name):
+    # Stable warm palette per function name, like classic flame graphs
+    value = zlib.crc32(name.encode("utf-8"))
+    return f"rgb({205 + value % 50},{(value >> 8) % 180},{(value >> 16) % 55})"
+
+def render_flame_graph(samples, title="Flame graph"):
+    """
+    Renders folded stack samples as a self-contained SVG flame graph
+    (callers at the bottom, width proportional to samples; hover for details).
+
+    Args:
+        samples (Counter): Folded stack string -> sample count.
+        title (str): Heading shown above the graph.
+
+    Returns:
+        str: SVG document.
+    """
+    root = _build_tree(samples)
+    total = root[0] or 1
+    rects = []
+    max_depth = 0
+
+    def walk(children, x, depth):
+        nonlocal max_depth
+        max_depth = max(max_depth, depth)
+        for name, (count, grandchildren) in sorted(children.items()):
+            width = count / total * FLAME_WIDTH
+            rects.append((name, count, x, depth, width))
+            walk(grandchildren, x, depth + 1)
+            x += width
+
+    walk(root[1], 0.0, 0)
+    height = (max_depth + 1) * FLAME_FRAME_HEIGHT + 40
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{FLAME_WIDTH}" height="{height}" font-family="Verdana" font-size="11">',
+        f'<rect width="100%" height="100%" fill="#f8f8f8"/>',
+        f'<text x="{FLAME_WIDTH / 2}" y="20" text-anchor="middle" font-size="15">{escape(title)}</text>',
+    ]
+    for name, count, x, depth, width in rects:
+        if width < 0.3:
+            continue
+        y = height - (depth + 1) * FLAME_FRAME_HEIGHT - 4
+        label = escape(name)
+        parts.append(
+            f'<g><title>{label} ({count} samples, {count / total:.1%})</title>'
+            f'<rect x="{x:.2f}" y="{y}" width="{width:.2f}" height="{FLAME_FRAME_HEIGHT - 1}" fill="{_frame_color(name)}" rx="2"/>'
+        )
+        if width >= FLAME_MIN_LABEL_WIDTH:
+            max_chars = int(width / 7)
+            text = name if len(name) <= max_chars else name[:max(max_chars - 2, 1)] + ".."
+            parts.append(f'<text x="{x + 3:.2f}" y="{y + FLAME_FRAME_HEIGHT - 4}">{escape(text)}</text>')
+        parts.append('</g>')
+    parts.append('</svg>')
+    return "\n".join(parts)
@@ -0,0 +1,116 @@
+import logging
+import threading
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Prompt templates are laid out for provider-side prompt caching: providers cache
+# the longest previously-seen prompt *prefix*, so everything that never changes
+# comes first, then the documents (deterministically ordered, so subscribers
+# uploading the same newsletters share the prefix), and only then the per-request
+# parts (user instructions, length, file names). Do not interpolate anything
+# request-specific into the constants below.
+
+DIGEST_SYSTEM_INSTRUCTIONS = "You are Inbox.fm's research assistant. You condense newsletters into faithful, neutral, information-dense digests."
+
+DIGEST_PROMPT_PREFIX = """**Task:** Produce a dense digest of the newsletter at the end of this message. It will be used later as the only source for personalized podcast scripts, so nothing important may be lost.
+
+**Keep:** Every distinct story, claim and argument; all figures, dates, company and people names; notable quotes; the author's stance or recommendations.
+**Drop:** Boilerplate such as ads, footers, unsubscribe links and social media prompts.
+
+**Output:** Produce ONLY the digest as concise bullet points grouped by story.
+
+**Newsletter Content:**
+"""
+
+SCRIPT_SYSTEM_INSTRUCTIONS = "You are Inbox.fm, an AI assistant that transforms email newsletters into personalized podcasts for busy professionals. Generate a clear, concise, and engaging podcast script based on the provided content and instructions."
+
+SCRIPT_PROMPT_PREFIX = """**Task:** Create a personalized podcast script summarizing and connecting insights from the newsletter digests below, following the listener's instructions that come after them.
+
+**Target Audience:** Busy millennial knowledge workers (25-40) in fields like finance, VC, and tech. They are intellectually curious and want actionable insights.
+
+**Podcast Goal:** Turn these newsletters into a concise, engaging audio summary that gives the listener an edge at work with minimal effort. Focus on key takeaways and meaningful connections between different sources if applicable.
+
+**Output:** Produce ONLY the podcast script, ready to be read aloud. Start directly with the script content. Do not include introductory phrases like "Here is the podcast script:". Structure it logically, perhaps with a brief intro, main points, and a brief outro mentioning it was generated by Inbox.fm. Refer to sources by their newsletter name, never by document ID.
+
+**Newsletter Digests:**
+"""
+
+DEFAULT_STYLE_INSTRUCTIONS = "Default: Professional, insightful, and engaging tone. Summarize key points clearly."
+
+def document_id(document_hash):
+    """Short, stable label for a document inside prompts."""
+    return document_hash[:12]
+
+def build_digest_prompt(document_text):
+    """Returns the user prompt for digesting one document (static prefix + document)."""
+    return f"{DIGEST_PROMPT_PREFIX}```\n{document_text}\n```"
+
+def build_script_prompt(digests, instructions, length_guidance):
+    """
+    Returns the user prompt for a personalized podcast script.
+
+    Args:
+        digests (list): (source_name, document_hash, digest) tuples. They are
+            ordered by document hash, so the same set of newsletters always
+            yields the same prompt prefix regardless of upload order.
+        instructions (str): User-provided style/content instructions.
+        length_guidance (str): Sentence describing the target length.
+
+    Returns:
+        str: The prompt.
+    """
+    ordered = sorted(digests, key=lambda item: item[1])
+    documents = "\n\n".join(f"[Document {document_id(document_hash)}]\n{digest}" for _, document_hash, digest in ordered)
+    # File names differ between subscribers, so they live in the variable suffix
+    sources = "\n".join(f"- Document {document_id(document_hash)}: {source_name or 'Newsletter'}" for source_name, document_hash, _ in ordered)
+
+    return (
+        f"{SCRIPT_PROMPT_PREFIX}```\n{documents}\n```\n\n"
+        f"**Document Sources (uploaded file names):**\n{sources}\n\n"
+        f"**User Instructions for Style/Content:**\n{instructions if instructions else DEFAULT_STYLE_INSTRUCTIONS}\n\n"
+        f"**Length Guidance:**\n{length_guidance}"
+    )
+
+
+class PromptCacheStats:
+    """
+    Process-wide tally of prompt tokens and provider-cached prompt tokens,
+    fed from the API usage of every chat completion.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def record(self, task, usage):
+        """
+        Records one completion's usage and logs its cache hit ratio.
+
+        Args:
+            task (str): Label for logs (e.g. "script").
+            usage (dict): model, prompt_tokens, cached_tokens, completion_tokens.
+        """
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        cached_tokens = usage.get("cached_tokens") or 0
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+            total_ratio = self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+        ratio = cached_tokens / prompt_tokens if prompt_tokens else 0.0
+        logging.info(
+            f"Prompt cache [{task}] {usage.get('model')}: {cached_tokens}/{prompt_tokens} prompt tokens cached ({ratio:.0%}); "
+            f"process total {total_ratio:.0%} over {self.requests} request(s)."
+        )
+
+    def summary(self):
+        """Returns the totals as a dict (requests, prompt_tokens, cached_tokens, cached_ratio)."""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "cached_ratio": self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+            }
@@ -0,0 +1,323 @@
+# Standard library imports
+import os
+import re
+import json
+import wave
+import shutil
+import logging
+import tempfile
+import subprocess
+import urllib.error
+import urllib.request
+from abc import ABC, abstractmethod
+
+# Third-party imports
+import openai
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Which backend GenAI uses: "openai" (default) or "local" (offline, no per-call cost).
+PROVIDER_ENV_VAR = "INBOXFM_PROVIDER"
+# Local backend: OpenAI-compatible chat server (e.g. llama.cpp's llama-server), e.g. http://127.0.0.1:8080
+LOCAL_LLM_URL_ENV_VAR = "INBOXFM_LOCAL_LLM_URL"
+# Local backend: path to a piper voice model (.onnx); espeak-ng is used when unset.
+PIPER_MODEL_ENV_VAR = "INBOXFM_PIPER_MODEL"
+
+# espeak-ng voices standing in for the OpenAI voice names offered in the UI.
+ESPEAK_VOICES = {
+    "nova": "en-us+f3",
+    "alloy": "en-us",
+    "echo": "en-us+m3",
+    "fable": "en-gb",
+    "onyx": "en-us+m7",
+    "shimmer": "en-us+f4",
+}
+
+# ffmpeg muxer names for TTS response formats whose name differs.
+FFMPEG_MUXERS = {"aac": "adts", "pcm": "s16le"}
+
+PLACEHOLDER_SAMPLE_RATE = 22050
+# A silent MPEG-1 Layer III frame (128 kbps, 44.1 kHz, ~26 ms).
+SILENT_MP3_FRAME = b"\xff\xfb\x90\x64" + b"\x00" * 413
+WORDS_PER_MINUTE = 150
+
+class Provider(ABC):
+    """
+    Interface for the text-generation and text-to-speech backend used by GenAI.
+
+    Implementations write audio to a file and return True, and raise on failure
+    (callers rely on exceptions rather than a False return). A backend that is
+    unreachable or overloaded should raise an error listed in
+    model_router.FALLBACK_ERRORS (e.g. ConnectionError) so routing can fall back.
+    """
+    name = "base"
+    requires_api_key = False
+
+    @abstractmethod
+    def generate_text(self, prompt, instructions, model, temperature=0.7, timeout=None, on_usage=None, max_retries=None):
+        """
+        Generates a chat completion.
+
+        Parameters:
+        ----------
+        prompt : str
+            The user message.
+        instructions : str
+            The system message.
+        model : str
+            Model name (backends without model choice may ignore it).
+        temperature : float, optional
+            Sampling temperature.
+        timeout : float, optional
+            Request timeout in seconds.
+        on_usage : callable, optional
+            Called with a dict (model, prompt_tokens, cached_tokens, completion_tokens).
+        max_retries : int, optional
+            Client-side retries; None keeps the backend's default.
+
+        Returns:
+        -------
+        str
+            The raw response text.
+        """
+
+    @abstractmethod
+    def generate_audio(self, text, file_path, model, voice, speed=1.0, response_format='mp3'):
+        """
+        Synthesizes `text` into `file_path` encoded as `response_format`.
+
+        Returns:
+        -------
+        bool
+            True on success.
+        """
+
+
+class OpenAIProvider(Provider):
+    """
+    OpenAI API backend (chat completions and TTS).
+
+    Attributes:
+    ----------
+    client : openai.Client
+        An instance of the OpenAI client initialized with the API key.
+    """
+    name = "openai"
+    requires_api_key = True
+
+    def __init__(self, openai_api_key):
+        if not openai_api_key:
+            raise ValueError("OpenAI API key is required.")
+        self.client = openai.Client(api_key=openai_api_key)
+
+    def generate_text(self, prompt, instructions, model, temperature=0.7, timeout=None, on_usage=None, max_retries=None):
+        client = self.client if max_retries is None else self.client.with_options(max_retries=max_retries)
+        completion = client.chat.completions.create(
+            model=model,
+            temperature=temperature,
+            timeout=timeout,
+            messages=[
+                {"role": "system", "content": instructions},
+                {"role": "user", "content": prompt}
+            ]
+        )
+        if on_usage and completion.usage:
+            details = getattr(completion.usage, "prompt_tokens_details", None)
+            on_usage({
+                "model": model,
+                "prompt_tokens": completion.usage.prompt_tokens,
+                "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+                "completion_tokens": completion.usage.completion_tokens,
+            })
+        return completion.choices[0].message.content
+
+    def generate_audio(self, text, file_path, model, voice, speed=1.0, response_format='mp3'):
+        response = self.client.audio.speech.create(
+            model=model,
+            voice=voice,
+            input=text,
+            speed=speed,
+            response_format=response_format
+        )
+        # Stream the audio content to the specified file
+        response.stream_to_file(file_path)
+        return True
+
+
+class LocalProvider(Provider):
+    """
+    Offline backend with no network round trips to paid APIs.
+
+    Text: an OpenAI-compatible local server (llama.cpp's llama-server, etc.) when
+    INBOXFM_LOCAL_LLM_URL is set, otherwise a deterministic extractive stand-in
+    that returns sentences from the prompt's fenced content (useful for CI).
+
+    Speech: piper when it is installed and INBOXFM_PIPER_MODEL is set, else
+    espeak-ng, else a silent placeholder whose length matches the text. Non-WAV
+    formats are transcoded with ffmpeg; the placeholder can also be written as MP3
+    without ffmpeg.
+    """
+    name = "local"
+
+    def __init__(self, llm_url=None, piper_model=None):
+        self.llm_url = (llm_url or os.getenv(LOCAL_LLM_URL_ENV_VAR) or "").rstrip("/") or None
+        self.piper_model = piper_model or os.getenv(PIPER_MODEL_ENV_VAR)
+
+    # --- Text ---
+
+    def generate_text(self, prompt, instructions, model, temperature=0.7, timeout=None, on_usage=None, max_retries=None):
+        if self.llm_url:
+            return self._generate_text_server(prompt, instructions, model, temperature, timeout, on_usage)
+        response = extractive_stand_in(prompt)
+        if on_usage:
+            on_usage({"model": "local-extractive", "prompt_tokens": len(prompt) // 4, "cached_tokens": 0, "completion_tokens": len(response) // 4})
+        return response
+
+    def _generate_text_server(self, prompt, instructions, model, temperature, timeout, on_usage):
+        payload = json.dumps({
+            "model": model,
+            "temperature": temperature,
+            "messages": [
+                {"role": "system", "content": instructions},
+                {"role": "user", "content": prompt}
+            ],
+        }).encode("utf-8")
+        request = urllib.request.Request(
+            f"{self.llm_url}/v1/chat/completions", data=payload, headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                body = json.load(response)
+        except urllib.error.HTTPError as e:
+            # Overloaded or failing server: let the router fall back; other HTTP errors are request errors
+            if e.code == 429 or e.code >= 500:
+                raise ConnectionError(f"Local LLM server returned HTTP {e.code}: {e.reason}") from e
+            raise
+        except urllib.error.URLError as e:
+            raise ConnectionError(f"Local LLM server at {self.llm_url} is unreachable: {e.reason}") from e
+        usage = body.get("usage") or {}
+        if on_usage and usage:
+            on_usage({
+                "model": body.get("model", model),
+                "prompt_tokens": usage.get("prompt_tokens", 0),
+                "cached_tokens": (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0),
+                "completion_tokens": usage.get("completion_tokens", 0),
+            })
+        return body["choices"][0]["message"]["content"]
+
+    # --- Speech ---
+
+    def generate_audio(self, text, file_path, model, voice, speed=1.0, response_format='mp3'):
+        if response_format == "wav":
+            self._synthesize_wav(text, file_path, voice, speed)
+            return True
+        if shutil.which("ffmpeg"):
+            with tempfile.TemporaryDirectory() as work_dir:
+                wav_path = os.path.join(work_dir, "speech.wav")
+                self._synthesize_wav(text, wav_path, voice, speed)
+                result = subprocess.run(
+                    ["ffmpeg", "-y", "-loglevel", "error", "-i", wav_path, "-f", FFMPEG_MUXERS.get(response_format, response_format), file_path],
+                    capture_output=True, text=True
+                )
+                if result.returncode != 0:
+                    raise RuntimeError(f"ffmpeg failed to encode local speech as {response_format}: {result.stderr.strip()}")
+            return True
+        if response_format == "mp3" and not self._speech_engine():
+            write_silent_mp3(file_path, estimate_speech_seconds(text, speed))
+            return True
+        raise RuntimeError(f"The local TTS backend needs ffmpeg to produce '{response_format}' audio.")
+
+    def _speech_engine(self):
+        if self.piper_model and shutil.which("piper"):
+            return "piper"
+        if shutil.which("espeak-ng"):
+            return "espeak-ng"
+        return None
+
+    def _synthesize_wav(self, text, wav_path, voice, speed):
+        engine = self._speech_engine()
+        if engine == "piper":
+            command = ["piper", "--model", self.piper_model, "--output_file", wav_path, "--length_scale", f"{1 / speed:.3f}"]
+            result = subprocess.run(command, input=text, capture_output=True, text=True)
+        elif engine == "espeak-ng":
+            command = ["espeak-ng", "-v", ESPEAK_VOICES.get(voice, "en-us"), "-s", str(int(175 * speed)), "-w", wav_path, "--stdin"]
+            result = subprocess.run(command, input=text, capture_output=True, text=True)
+        else:
+            logging.warning("No local TTS engine (piper/espeak-ng) found; writing silent placeholder audio.")
+            write_silent_wav(wav_path, estimate_speech_seconds(text, speed))
+            return
+        if result.returncode != 0:
+            raise RuntimeError(f"{engine} failed: {result.stderr.strip()}")
+
+def estimate_speech_seconds(text, speed=1.0):
+    """Approximate narration length of `text` in seconds."""
+    return max(0.5, len(text.split()) / WORDS_PER_MINUTE * 60 / speed)
+
+def write_silent_wav(file_path, seconds):
+    """Writes a mono 16-bit silent WAV of the given length."""
+    with wave.open(file_path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(PLACEHOLDER_SAMPLE_RATE)
+        wav.writeframes(b"\x00\x00" * int(PLACEHOLDER_SAMPLE_RATE * seconds))
+
+def write_silent_mp3(file_path, seconds):
+    """Writes a silent MP3 of approximately the given length."""
+    frames = int(seconds / 0.026) + 1
+    with open(file_path, "wb") as f:
+        f.write(SILENT_MP3_FRAME * frames)
+
+def extractive_stand_in(prompt, max_sentences=24, sentences_per_paragraph=3):
+    """
+    Deterministic offline replacement for an LLM response: the first sentences
+    of the prompt's fenced (```) content, grouped into short paragraphs.
+    """
+    fenced = re.findall(r"```(.*?)```", prompt, flags=re.DOTALL)
+    source = "\n".join(fenced) if fenced else prompt
+    lines = [line.strip(" -*\t") for line in source.splitlines()]
+    # Skip document labels such as "[Document 1a2b3c]"
+    text = " ".join(line for line in lines if line and not re.fullmatch(r"\[.*\]", line))
+    sentences = [s for s in re.split(r"(?<=[.!?])\s+", text) if s][:max_sentences]
+    paragraphs = [
+        " ".join(sentences[i:i + sentences_per_paragraph])
+        for i in range(0, len(sentences), sentences_per_paragraph)
+    ]
+    return "\n\n".join(paragraphs) or "No content was provided."
+
+# Provider classes by name, for checks that do not need an instance.
+PROVIDER_CLASSES = {
+    OpenAIProvider.name: OpenAIProvider,
+    LocalProvider.name: LocalProvider,
+}
+
+def get_provider(name=None, openai_api_key=None):
+    """
+    Builds the configured provider.
+
+    Parameters:
+    ----------
+    name : str, optional
+        "openai" or "local"; defaults to the INBOXFM_PROVIDER environment variable, then "openai".
+    openai_api_key : str, optional
+        Required for the OpenAI provider.
+
+    Returns:
+    -------
+    Provider
+    """
+    name = (name or configured_provider_name()).strip().lower()
+    if name == "openai":
+        return OpenAIProvider(openai_api_key)
+    if name == "local":
+        return LocalProvider()
+    raise ValueError(f"Unknown provider '{name}'. Use 'openai' or 'local'.")
+
+def configured_provider_name():
+    """The provider name selected by the environment (without building it)."""
+    return (os.getenv(PROVIDER_ENV_VAR) or "openai").strip().lower()
+
+def provider_requires_api_key(name=None):
+    """Whether the named (default: configured) provider needs OPENAI_API_KEY; unknown names do not."""
+    provider_class = PROVIDER_CLASSES.get((name or configured_provider_name()).strip().lower())
+    return bool(provider_class and provider_class.requires_api_key)
@@ -0,0 +1,301 @@
+import os
+import re
+import math
+import shutil
+import difflib
+import hashlib
+import logging
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from profiling import worker_thread_prefix
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Upper bound for the text of one segment (~40 seconds of speech). Keeps the first
+# segment fast to synthesize and stays well under the TTS API input limit.
+SEGMENT_MAX_CHARS = 600
+
+# Segments synthesized concurrently. Later segments are prepared while earlier ones play.
+SEGMENT_WORKERS = int(os.getenv("INBOXFM_SEGMENT_WORKERS", "3"))
+
+PLAYLIST_FILENAME = "playlist.m3u8"
+
+# MPEG audio Layer III bitrates (kbps) by bitrate index, for MPEG-1 and MPEG-2/2.5.
+_MP3_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+# Sample rates by version bits (3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5) and rate index.
+_MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+def split_script_into_segments(script_text, max_chars=SEGMENT_MAX_CHARS):
+    """
+    Splits a podcast script into short, ordered segments for synthesis.
+
+    Each paragraph becomes at least one segment; paragraphs longer than
+    `max_chars` are split at sentence boundaries.
+
+    Args:
+        script_text (str): The podcast script.
+        max_chars (int): Maximum characters per segment (a single longer
+            sentence is kept whole).
+
+    Returns:
+        list: Segment texts in reading order.
+    """
+    segments = []
+    for paragraph in re.split(r"\n\s*\n", script_text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            segments.append(paragraph)
+            continue
+        current = ""
+        for sentence in _SENTENCE_END.split(paragraph):
+            if current and len(current) + 1 + len(sentence) > max_chars:
+                segments.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+        if current:
+            segments.append(current)
+    return segments
+
+def segment_filename(index, text, extension):
+    """
+    Returns the file name of segment `index` (zero-based), e.g. 'seg_0003_1a2b3c4d5e.mp3'.
+
+    The name includes a hash of the segment text, so an existing file is known to
+    match its text and can be reused when synthesis is resumed or repeated.
+    """
+    text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()[:10]
+    return f"seg_{index:04d}_{text_hash}.{extension}"
+
+def mp3_duration_seconds(file_path):
+    """
+    Returns the playing time of an MP3 file by walking its frame headers.
+
+    The playlist needs real durations: HLS players place each segment on the
+    timeline from the EXTINF values, so estimates would leave gaps or overlaps.
+    """
+    with open(file_path, "rb") as f:
+        data = f.read()
+    offset = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        tag_size = (data[6] & 0x7f) << 21 | (data[7] & 0x7f) << 14 | (data[8] & 0x7f) << 7 | (data[9] & 0x7f)
+        offset = 10 + tag_size + (10 if data[5] & 0x10 else 0)
+    seconds = 0.0
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF or data[offset + 1] & 0xE0 != 0xE0:
+            offset += 1
+            continue
+        version = (data[offset + 1] >> 3) & 3
+        layer = (data[offset + 1] >> 1) & 3
+        bitrate_index = data[offset + 2] >> 4
+        rate_index = (data[offset + 2] >> 2) & 3
+        if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+            # Not a Layer III frame header: resynchronize
+            offset += 1
+            continue
+        sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+        bitrate = _MP3_BITRATES[1 if version == 3 else 2][bitrate_index] * 1000
+        samples = 1152 if version == 3 else 576
+        padding = (data[offset + 2] >> 1) & 1
+        seconds += samples / sample_rate
+        offset += samples // 8 * bitrate // sample_rate + padding
+    return seconds
+
+
+class SegmentPlaylist:
+    """
+    An HLS (EVENT) playlist that grows as segments finish, for live playback.
+
+    The playlist and the MP3 files it lists live together in `directory`, which
+    the app serves over HTTP. Each added file is hard-linked in (copied where
+    linking is not supported) and the playlist is rewritten atomically after
+    every segment, so a player polling it never reads a partial playlist.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, PLAYLIST_FILENAME)
+        self.entries = []
+        self.finished = False
+        # Every playback starts from an empty playlist (e.g. when a run is resumed)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+        self._write()
+
+    def add(self, mp3_path):
+        """Publishes a finished MP3 segment and republishes the playlist."""
+        name = f"part_{len(self.entries):04d}.mp3"
+        target = os.path.join(self.directory, name)
+        try:
+            os.link(mp3_path, target)
+        except OSError:
+            shutil.copyfile(mp3_path, target)
+        self.entries.append((name, mp3_duration_seconds(target)))
+        self._write()
+
+    def finish(self):
+        """Marks the playlist complete (no more segments will be added)."""
+        if not self.finished:
+            self.finished = True
+            self._write()
+
+    def _write(self):
+        target_duration = max([1] + [math.ceil(duration) for _, duration in self.entries])
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+            f"#EXT-X-TARGETDURATION:{target_duration}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+        ]
+        for name, duration in self.entries:
+            lines.append(f"#EXTINF:{duration:.3f},")
+            lines.append(name)
+        if self.finished:
+            lines.append("#EXT-X-ENDLIST")
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.path)
+
+def synthesize_segments(segments, segment_dir, extension, synthesize_fn, on_segment=None, max_workers=SEGMENT_WORKERS, reuse_existing=False):
+    """
+    Synthesizes segments concurrently and publishes them strictly in order.
+
+    Args:
+        segments (list): Segment texts in order.
+        segment_dir (str): Directory for the segment files.
+        extension (str): Audio file extension of the segments.
+        synthesize_fn (callable): Called as `synthesize_fn(text, file_path)`;
+            must write the audio file (raising on failure).
+        on_segment (callable, optional): Called in the caller's thread as
+            `on_segment(index, file_path, total)` once each segment, and every
+            segment before it, is ready.
+        max_workers (int): Maximum concurrent synthesis calls.
+        reuse_existing (bool): Skip segments whose file already exists (non-empty),
+            e.g. when resuming an interrupted run.
+
+    Returns:
+        list: Segment file paths in order.
+    """
+    os.makedirs(segment_dir, exist_ok=True)
+    paths = [os.path.join(segment_dir, segment_filename(i, text, extension)) for i, text in enumerate(segments)]
+
+    def synthesize_one(text, path):
+        if reuse_existing and os.path.exists(path) and os.path.getsize(path) > 0:
+            return
+        # Write to a temporary name so an interrupted call never leaves a reusable partial file
+        tmp_path = f"{path}.partial"
+        synthesize_fn(text, tmp_path)
+        os.replace(tmp_path, path)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix=worker_thread_prefix("tts")) as executor:
+        futures = [executor.submit(synthesize_one, text, path) for text, path in zip(segments, paths)]
+        try:
+            for index, future in enumerate(futures):
+                future.result() # Raises if this segment failed
+                logging.info(f"Segment {index + 1}/{len(segments)} ready: {paths[index]}")
+                if on_segment:
+                    on_segment(index, paths[index], len(segments))
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+
+    return paths
+
+def match_unchanged_segments(old_segments, new_segments):
+    """
+    Diffs two versions of a segmented script and pairs up unchanged segments.
+
+    Args:
+        old_segments (list): Segment texts of the previous script version.
+        new_segments (list): Segment texts of the edited script.
+
+    Returns:
+        dict: New segment index -> old segment index, for every segment whose
+            text is unchanged. Segments missing from the dict are new or edited.
+    """
+    matcher = difflib.SequenceMatcher(None, old_segments, new_segments, autojunk=False)
+    unchanged = {}
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag == "equal":
+            for offset in range(new_end - new_start):
+                unchanged[new_start + offset] = old_start + offset
+    return unchanged
+
+def carry_over_segments(old_paths, new_segments, segment_dir, extension, unchanged):
+    """
+    Makes the audio of unchanged segments available under their new file names,
+    so synthesize_segments(..., reuse_existing=True) only synthesizes the rest.
+
+    Files are hard-linked (copied where linking is not supported) rather than
+    renamed, so a segment that moved can never displace another one.
+
+    Args:
+        old_paths (list): Segment files of the previous version, in order.
+        new_segments (list): Segment texts of the edited script.
+        segment_dir (str): Directory of the segment files.
+        extension (str): Audio file extension of the segments.
+        unchanged (dict): Output of match_unchanged_segments.
+
+    Returns:
+        int: Number of segments carried over.
+    """
+    carried = 0
+    for new_index, old_index in unchanged.items():
+        source = old_paths[old_index]
+        target = os.path.join(segment_dir, segment_filename(new_index, new_segments[new_index], extension))
+        if not os.path.exists(source):
+            continue
+        if os.path.abspath(source) != os.path.abspath(target) and not os.path.exists(target):
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copyfile(source, target)
+        carried += 1
+    return carried
+
+def concatenate_segments(segment_paths, output_path):
+    """
+    Joins segment files into a single episode file.
+
+    MP3 segments are joined byte-wise (MP3 frames are self-contained); other
+    formats are remuxed with ffmpeg's concat demuxer without re-encoding.
+
+    Raises:
+        RuntimeError: If the format needs ffmpeg and it is not installed, or ffmpeg fails.
+    """
+    if len(segment_paths) == 1:
+        shutil.copyfile(segment_paths[0], output_path)
+        return output_path
+    if all(path.lower().endswith(".mp3") for path in segment_paths):
+        with open(output_path, "wb") as out:
+            for path in segment_paths:
+                with open(path, "rb") as segment:
+                    shutil.copyfileobj(segment, out)
+        return output_path
+
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError("ffmpeg is required to join non-MP3 segments.")
+    with tempfile.NamedTemporaryFile('w', suffix=".txt", delete=False, encoding='utf-8') as list_file:
+        for path in segment_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+    try:
+        command = ["ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_file.name, "-c", "copy", output_path]
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed to join segments: {result.stderr.strip()}")
+    finally:
+        os.remove(list_file.name)
+    return output_path
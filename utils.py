@@ -1,8 +1,28 @@
 import os
+import re
 import tempfile
 import logging
 from pathlib import Path
+from collections import namedtuple
 from genai import GenAI # Assuming genai.py is in the same directory
+from providers import configured_provider_name, provider_requires_api_key
+from digest_cache import DigestCache, content_hash
+from model_router import ModelRouter, QUALITY_MODEL, FAST_MODEL, ROUTED_MAX_RETRIES, estimate_tokens
+from prompts import (
+    DIGEST_SYSTEM_INSTRUCTIONS, SCRIPT_SYSTEM_INSTRUCTIONS, PromptCacheStats,
+    build_digest_prompt, build_script_prompt,
+)
+from audio_formats import (
+    DEFAULT_AUDIO_PROFILE, MASTER_FORMAT, get_audio_profile, audio_filename,
+    rendition_path, ffmpeg_available, transcode, master_tts_model,
+)
+from segments import (
+    split_script_into_segments, synthesize_segments, concatenate_segments,
+    match_unchanged_segments, carry_over_segments,
+)
+
+# Live HLS playback takes MP3 segments; segments in other formats get an MP3 copy in this profile.
+LIVE_PREVIEW_PROFILE = "standard"
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -14,20 +34,37 @@ from dotenv import load_dotenv
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Which backend to use ("openai" or "local"); see providers.py
+PROVIDER_NAME = configured_provider_name()
+
 # Initialize the GenAI class (handles API calls)
-# Check if the API key is loaded
-if not OPENAI_API_KEY:
+# Check if the API key is loaded (only the OpenAI provider needs one)
+if provider_requires_api_key(PROVIDER_NAME) and not OPENAI_API_KEY:
     logging.error("OPENAI_API_KEY environment variable not found.")
     # You might want to raise an error or handle this case appropriately
     # For now, we'll let GenAI raise an error if it's not provided.
     jarvis = None
 else:
     try:
-        jarvis = GenAI(OPENAI_API_KEY)
+        jarvis = GenAI(OPENAI_API_KEY, provider=PROVIDER_NAME)
     except ValueError as e:
         logging.error(f"Failed to initialize GenAI: {e}")
         jarvis = None # Ensure jarvis is None if initialization fails
 
+# Shared across all sessions in this process: each distinct newsletter document
+# is summarized once and the digest is reused by every subscriber's script.
+digest_cache = DigestCache()
+
+# Shared across all sessions so latency/error observations inform every routing decision.
+model_router = ModelRouter()
+
+# Cached-token accounting from API usage, to verify the prompt layout keeps hitting the provider cache.
+prompt_cache_stats = PromptCacheStats()
+
+# Header written between documents in the combined text; also used to split it back.
+DOCUMENT_HEADER = "--- Content from {name} ---"
+DOCUMENT_HEADER_PATTERN = re.compile(r"^--- Content from (.+?) ---$", re.MULTILINE)
+
 # --- File Reading ---
 
 def read_uploaded_files(uploaded_files, temp_dir):
@@ -76,7 +113,7 @@ def read_uploaded_files(uploaded_files, temp_dir):
                 continue # Skip to next file
 
             if content:
-                combined_text += f"\n\n--- Content from {uploaded_file.name} ---\n\n" + content
+                combined_text += "\n\n" + DOCUMENT_HEADER.format(name=uploaded_file.name) + "\n\n" + content
                 read_files.append(uploaded_file.name)
             else:
                 logging.warning(f"No content extracted from: {uploaded_file.name}")
@@ -99,6 +136,10 @@ def read_uploaded_files(uploaded_files, temp_dir):
 
 # --- Podcast Generation Logic ---
 
+# Models used to build the shared per-document digests, in fallback order. Digests are
+# computed once per distinct document, so the quality model is affordable here.
+DIGEST_MODELS = [QUALITY_MODEL, FAST_MODEL]
+
 def estimate_word_count(length_option):
     """Estimates target word count based on length option."""
     if length_option == "2 mins":
@@ -110,10 +151,109 @@ def estimate_word_count(length_option):
     else: # Auto or unspecified
         return None # Let the AI decide or use a default logic
 
+# Script length assumed for "Auto" when estimating costs (~6-7 minutes).
+DEFAULT_ESTIMATE_WORDS = 1000
+
+def estimate_run_cost(newsletter_text, length_option="Auto", from_stage="script"):
+    """
+    Estimates what a generation run will spend, before any API call is made.
+
+    Args:
+        newsletter_text (str): The extracted newsletter text.
+        length_option (str): Desired length ("Auto", "2 mins", "5 mins", "10 mins").
+        from_stage (str): First pipeline stage that still has to run; a run
+            resumed at "synthesize" or "assemble" spends no more tokens.
+
+    Returns:
+        tuple: (chat tokens, TTS characters)
+    """
+    script_words = estimate_word_count(length_option) or DEFAULT_ESTIMATE_WORDS
+    # Roughly 6 characters (including the space) per spoken word
+    tts_chars = script_words * 6 if from_stage in ("script", "synthesize") else 0
+    if from_stage != "script":
+        return 0, tts_chars
+    # Digest prompts read the whole text once; the script prompt reads the digests
+    # (about the script's size) and writes the script (~1.3 tokens per word)
+    tokens = estimate_tokens(newsletter_text) + estimate_tokens(tts_chars) + int(script_words * 1.3)
+    return tokens, tts_chars
+
+def split_newsletter_documents(newsletter_text):
+    """
+    Splits combined newsletter text back into its individual documents.
+
+    Args:
+        newsletter_text (str): Text as produced by read_uploaded_files.
+
+    Returns:
+        list: (source_name, document_text) tuples in their original order.
+              Text without document headers is returned as a single document
+              with source_name None.
+    """
+    matches = list(DOCUMENT_HEADER_PATTERN.finditer(newsletter_text))
+    if not matches:
+        return [(None, newsletter_text.strip())]
+
+    documents = []
+    for i, match in enumerate(matches):
+        body_end = matches[i + 1].start() if i + 1 < len(matches) else len(newsletter_text)
+        body = newsletter_text[match.end():body_end].strip()
+        if body:
+            documents.append((match.group(1), body))
+    return documents
+
+def generate_newsletter_digest(document_text):
+    """
+    Summarizes a single newsletter document into a reusable digest.
+
+    The digest is listener-neutral (no user instructions) so it can be shared
+    by every subscriber who uploads the same document.
+
+    Args:
+        document_text (str): Text of one newsletter document.
+
+    Returns:
+        str: The digest text.
+    """
+    if not jarvis:
+        raise RuntimeError("GenAI service is not available.")
+
+    prompt = build_digest_prompt(document_text)
+
+    return model_router.run(
+        lambda model, timeout: jarvis.generate_text(
+            prompt, instructions=DIGEST_SYSTEM_INSTRUCTIONS, model=model, temperature=0.2, timeout=timeout,
+            max_retries=ROUTED_MAX_RETRIES,
+            on_usage=lambda usage: prompt_cache_stats.record("digest", usage),
+        ),
+        input_chars=len(document_text),
+        task="digest",
+        models=DIGEST_MODELS,
+    )
+
+def get_newsletter_digests(newsletter_text):
+    """
+    Returns digests for every document in the combined newsletter text,
+    computing only the ones not already present in the shared digest cache.
+
+    Args:
+        newsletter_text (str): Text as produced by read_uploaded_files.
+
+    Returns:
+        list: (source_name, document_hash, digest) tuples in document order.
+    """
+    digests = []
+    for source_name, document_text in split_newsletter_documents(newsletter_text):
+        digest = digest_cache.get_or_compute(document_text, generate_newsletter_digest)
+        digests.append((source_name, content_hash(document_text), digest))
+    return digests
+
 def generate_podcast_script(newsletter_text, instructions, length_option="Auto"):
     """
     Generates a podcast script using the AI based on newsletter content and instructions.
 
+    Each newsletter is first reduced to a cached digest (see get_newsletter_digests);
+    the personalized script is then written from those digests.
+
     Args:
         newsletter_text (str): Combined text from the uploaded newsletters.
         instructions (str): User-provided instructions for style, tone, focus.
@@ -130,72 +270,271 @@ def generate_podcast_script(newsletter_text, instructions, length_option="Auto")
     word_count_target = estimate_word_count(length_option)
     length_guidance = f"Aim for a podcast script approximately {word_count_target} words long." if word_count_target else "Determine an appropriate length based on the content."
 
-    # Construct the prompt for the AI
-    prompt = f"""
-    **Task:** Create a personalized podcast script summarizing and connecting insights from the following newsletter content.
-
-    **Target Audience:** Busy millennial knowledge workers (25-40) in fields like finance, VC, and tech. They are intellectually curious and want actionable insights.
+    digests = get_newsletter_digests(newsletter_text)
+    # Static instructions first, then hash-ordered digests, then per-request details (see prompts.py)
+    prompt = build_script_prompt(digests, instructions, length_guidance)
 
-    **Podcast Goal:** Turn these newsletters into a concise, engaging audio summary that gives the listener an edge at work with minimal effort. Focus on key takeaways and meaningful connections between different sources if applicable.
+    logging.info(f"Generating podcast script from {len(digests)} digest(s) with length option: {length_option}")
+    try:
+        # The router picks the model from input size, requested length and recent model health
+        script = model_router.run(
+            lambda model, timeout: jarvis.generate_text(
+                prompt, instructions=SCRIPT_SYSTEM_INSTRUCTIONS, model=model, timeout=timeout,
+                max_retries=ROUTED_MAX_RETRIES,
+                on_usage=lambda usage: prompt_cache_stats.record("script", usage),
+            ),
+            input_chars=sum(len(digest) for _, _, digest in digests),
+            target_words=word_count_target,
+            task="script",
+        )
+        logging.info("Podcast script generated successfully.")
+        return script
+    except Exception as e:
+        logging.error(f"Error generating podcast script: {e}")
+        raise # Re-raise the exception to be handled by the caller
 
-    **User Instructions for Style/Content:**
-    {instructions if instructions else "Default: Professional, insightful, and engaging tone. Summarize key points clearly."}
+def segment_dir_for(output_dir, filename):
+    """Returns the directory holding the segments of a segmented episode."""
+    return os.path.join(output_dir, f"{Path(filename).stem}_segments")
 
-    **Length Guidance:**
-    {length_guidance}
+def _needs_local_transcode(profile, extra_profiles):
+    """True if the outputs must be transcoded locally (and ffmpeg is there to do it)."""
+    wants_transcode = profile.requires_transcode or bool(extra_profiles)
+    if wants_transcode and not ffmpeg_available():
+        logging.warning("ffmpeg not found; synthesizing the primary profile directly and skipping renditions.")
+        return False
+    return wants_transcode
 
-    **Newsletter Content:**
-    ```
-    {newsletter_text}
-    ```
+# How an episode is synthesized (see plan_synthesis).
+#   segmented: the script is split into short segments; otherwise it is synthesized in one piece.
+#   master: the TTS output is a lossless master that every output is transcoded from.
+SynthesisPlan = namedtuple("SynthesisPlan", ["segmented", "master", "tts_model", "tts_format", "extension"])
 
-    **Output:**
-    Produce ONLY the podcast script, ready to be read aloud. Start directly with the script content. Do not include introductory phrases like "Here is the podcast script:". Structure it logically, perhaps with a brief intro, main points, and a brief outro mentioning it was generated by Inbox.fm.
+def plan_synthesis(audio_profile=DEFAULT_AUDIO_PROFILE, renditions=None):
     """
+    Decides how an episode is synthesized, before any TTS call is made.
 
-    # Define system instructions for the AI model
-    system_instructions = "You are Inbox.fm, an AI assistant that transforms email newsletters into personalized podcasts for busy professionals. Generate a clear, concise, and engaging podcast script based on the provided content and instructions."
+    When ffmpeg is available and either extra renditions are requested or the
+    profile needs exact encoder settings, segments are synthesized as a
+    lossless master (MASTER_FORMAT) and every output is transcoded from it.
+    Otherwise segments use the profile's own TTS format. Without ffmpeg,
+    segments other than MP3 could not be joined, so the script is then
+    synthesized in one piece.
 
-    logging.info(f"Generating podcast script with length option: {length_option}")
+    Args:
+        audio_profile (str): Name of the primary audio profile.
+        renditions (list, optional): Additional profile names.
+
+    Returns:
+        SynthesisPlan: segmented, master, tts_model, tts_format and extension.
+    """
+    profile = get_audio_profile(audio_profile)
+    extra_profiles = [get_audio_profile(name) for name in (renditions or []) if name != profile.name]
+    if _needs_local_transcode(profile, extra_profiles):
+        return SynthesisPlan(True, True, master_tts_model([profile, *extra_profiles]), MASTER_FORMAT, MASTER_FORMAT)
+    segmented = profile.tts_format == "mp3" or ffmpeg_available()
+    if not segmented:
+        logging.warning(f"ffmpeg not found; synthesizing the '{profile.name}' episode in one piece, without progressive playback.")
+    return SynthesisPlan(segmented, False, profile.tts_model, profile.tts_format, profile.extension)
+
+def _synthesize(text, path, tts_model, voice_name, speed, response_format):
+    """Runs one TTS call, raising if it reports failure."""
+    success = jarvis.generate_audio(text, path, model=tts_model, voice=voice_name, speed=speed, response_format=response_format)
+    if not success:
+        # This part might not be reached if generate_audio raises an exception on failure
+        raise RuntimeError("Audio generation reported failure without exception.")
+
+def _finalize_audio(source_path, audio_path, profile, extra_profiles):
+    """Transcodes `source_path` into the primary profile and each rendition, then removes it."""
     try:
-        script = jarvis.generate_text(prompt, instructions=system_instructions, model="gpt-4o") # Use a powerful model
-        logging.info("Podcast script generated successfully.")
-        return script
-    except Exception as e:
-        logging.error(f"Error generating podcast script: {e}")
-        raise # Re-raise the exception to be handled by the caller
+        transcode(source_path, audio_path, profile)
+        for extra in extra_profiles:
+            try:
+                transcode(source_path, rendition_path(audio_path, extra), extra)
+            except RuntimeError as e:
+                # A missing rendition should not fail the episode
+                logging.error(f"Skipping rendition {extra.name}: {e}")
+    finally:
+        if os.path.exists(source_path):
+            os.remove(source_path)
+
+def synthesize_podcast_segments(script_text, segment_dir, voice_name='nova', speed=1.0, audio_profile=DEFAULT_AUDIO_PROFILE, on_segment=None, reuse_existing=False, renditions=None):
+    """
+    Synthesizes the script as ordered short segments.
+
+    The segment format follows plan_synthesis: lossless master segments when the
+    outputs are transcoded locally, else the profile's own TTS format. When the
+    plan is not segmented, the whole script is synthesized as a single segment
+    and `on_segment` is not called.
+
+    Args:
+        script_text (str): The podcast script.
+        segment_dir (str): Directory for the segment files.
+        voice_name (str): The AI voice to use.
+        speed (float): Speech speed.
+        audio_profile (str): Name of the audio profile.
+        on_segment (callable, optional): Called as `on_segment(index, segment_path, total)`
+            as each segment becomes playable.
+        reuse_existing (bool): Keep segments already synthesized by an earlier attempt.
+        renditions (list, optional): Additional profile names the episode is assembled into.
+
+    Returns:
+        list: Segment file paths in order.
+    """
+    if not jarvis:
+        raise RuntimeError("GenAI service is not available.")
+    if not script_text:
+        raise ValueError("Script text cannot be empty.")
 
-def generate_podcast_audio(script_text, output_dir, voice_name='nova', speed=1.0, filename="podcast_output.mp3"):
+    plan = plan_synthesis(audio_profile, renditions)
+    return synthesize_segments(
+        split_script_into_segments(script_text) if plan.segmented else [script_text.strip()],
+        segment_dir,
+        plan.extension,
+        lambda text, path: _synthesize(text, path, plan.tts_model, voice_name, speed, plan.tts_format),
+        on_segment=on_segment if plan.segmented else None,
+        reuse_existing=reuse_existing,
+    )
+
+def publish_live_segment(playlist, segment_path):
+    """
+    Adds a finished segment to a live playlist (segments.SegmentPlaylist).
+
+    MP3 segments are published as they are. Other formats are first transcoded
+    to an MP3 copy; segments only come in those formats when ffmpeg is
+    available, since joining them needs it too.
+
+    Args:
+        playlist (SegmentPlaylist): The live playlist.
+        segment_path (str): The finished segment file.
+    """
+    if segment_path.lower().endswith(".mp3"):
+        playlist.add(segment_path)
+        return
+    with tempfile.TemporaryDirectory() as work_dir:
+        preview_path = os.path.join(work_dir, "preview.mp3")
+        transcode(segment_path, preview_path, LIVE_PREVIEW_PROFILE)
+        playlist.add(preview_path)
+
+def carry_over_unchanged_segments(previous_script, previous_segment_paths, script_text, segment_dir, audio_profile=DEFAULT_AUDIO_PROFILE, renditions=None):
+    """
+    Prepares an edited script for an incremental rebuild: diffs it against the
+    previous version paragraph by paragraph and carries the audio of unchanged
+    segments over, so synthesize_podcast_segments(..., reuse_existing=True)
+    only sends new or edited paragraphs to TTS.
+
+    Args:
+        previous_script (str): The script the existing segments were synthesized from.
+        previous_segment_paths (list): Those segment files, in order.
+        script_text (str): The edited script.
+        segment_dir (str): Directory of the segment files.
+        audio_profile (str): Name of the audio profile the segments use.
+        renditions (list, optional): Additional profile names (they decide the segment format).
+
+    Returns:
+        tuple: (segments carried over, total segments in the edited script,
+            characters of the segments that still have to be synthesized)
+    """
+    previous_segments = split_script_into_segments(previous_script)
+    segments = split_script_into_segments(script_text)
+    if len(previous_segments) != len(previous_segment_paths):
+        logging.warning("Existing segments do not match the previous script; rebuilding all segments.")
+        return 0, len(segments), sum(len(segment) for segment in segments)
+    unchanged = match_unchanged_segments(previous_segments, segments)
+    plan = plan_synthesis(audio_profile, renditions)
+    carried = carry_over_segments(previous_segment_paths, segments, segment_dir, plan.extension, unchanged)
+    changed_chars = sum(len(segment) for index, segment in enumerate(segments) if index not in unchanged)
+    logging.info(f"Script edit: reusing {carried} of {len(segments)} segments, synthesizing {len(segments) - carried} ({changed_chars} characters).")
+    return carried, len(segments), changed_chars
+
+def assemble_podcast_audio(segment_paths, output_dir, filename="podcast_output.mp3", audio_profile=DEFAULT_AUDIO_PROFILE, renditions=None):
+    """
+    Joins synthesized segments into the episode file (plus renditions when ffmpeg is available).
+
+    Lossless master segments (see plan_synthesis) are joined into a master that
+    the primary profile and every rendition are transcoded from.
+
+    Args:
+        segment_paths (list): Segment files in order (see synthesize_podcast_segments).
+        output_dir (str): Directory to save the audio file.
+        filename (str): The name for the output audio file; the extension follows the profile.
+        audio_profile (str): Name of the primary audio profile.
+        renditions (list, optional): Additional profile names to transcode.
+
+    Returns:
+        str: The full path to the episode file.
+    """
+    profile = get_audio_profile(audio_profile)
+    extra_profiles = [get_audio_profile(name) for name in (renditions or []) if name != profile.name]
+    stem = Path(filename).stem
+    os.makedirs(output_dir, exist_ok=True)
+    audio_path = os.path.join(output_dir, audio_filename(stem, profile))
+
+    if plan_synthesis(profile, renditions).master:
+        master_path = os.path.join(output_dir, f"{stem}.master.{MASTER_FORMAT}")
+        concatenate_segments(segment_paths, master_path)
+        _finalize_audio(master_path, audio_path, profile, extra_profiles)
+    else:
+        concatenate_segments(segment_paths, audio_path)
+    return audio_path
+
+def generate_podcast_audio(script_text, output_dir, voice_name='nova', speed=1.0, filename="podcast_output.mp3", audio_profile=DEFAULT_AUDIO_PROFILE, renditions=None, segmented=False, on_segment=None):
     """
     Generates the podcast audio file from the script using AI TTS.
 
+    When ffmpeg is available and either extra renditions are requested or the
+    profile needs exact encoder settings, the script is synthesized once into a
+    lossless master and every output is transcoded locally from it. Otherwise the
+    primary profile is synthesized directly and renditions are skipped.
+
+    In segmented mode the script is synthesized as short segments (see
+    synthesize_podcast_segments) in segment_dir_for(output_dir, filename),
+    reported through `on_segment` so playback can start before the episode is
+    complete, and then joined into the episode file (see assemble_podcast_audio).
+
     Args:
         script_text (str): The podcast script.
         output_dir (str): Directory to save the audio file.
         voice_name (str): The AI voice to use.
         speed (float): Speech speed.
-        filename (str): The name for the output audio file.
+        filename (str): The name for the output audio file. Its extension is
+            replaced by the profile's extension.
+        audio_profile (str): Name of the primary audio profile (see audio_formats.AUDIO_PROFILES).
+        renditions (list, optional): Additional profile names to produce from the same synthesis.
+            Each is stored at audio_formats.rendition_path(primary_path, profile).
+        segmented (bool): Emit the episode as ordered segments before joining them.
+        on_segment (callable, optional): Segmented mode only; called as
+            `on_segment(index, segment_path, total)` as each segment becomes playable.
 
     Returns:
-        str: The full path to the generated audio file.
+        str: The full path to the generated (primary) audio file.
     """
     if not jarvis:
         raise RuntimeError("GenAI service is not available.")
     if not script_text:
         raise ValueError("Script text cannot be empty.")
 
-    audio_path = os.path.join(output_dir, filename)
-    logging.info(f"Generating podcast audio file at: {audio_path}")
+    profile = get_audio_profile(audio_profile)
+    extra_profiles = [get_audio_profile(name) for name in (renditions or []) if name != profile.name]
+    stem = Path(filename).stem
+    audio_path = os.path.join(output_dir, audio_filename(stem, profile))
+    logging.info(f"Generating podcast audio file at: {audio_path} (profile: {profile.name}, segmented: {segmented})")
 
     try:
-        success = jarvis.generate_audio(script_text, audio_path, voice=voice_name, speed=speed)
-        if success:
-            logging.info("Podcast audio generated successfully.")
-            return audio_path
+        if segmented:
+            segment_paths = synthesize_podcast_segments(
+                script_text, segment_dir_for(output_dir, filename), voice_name, speed, profile, on_segment=on_segment, renditions=renditions
+            )
+            assemble_podcast_audio(segment_paths, output_dir, filename, profile, renditions)
+        elif _needs_local_transcode(profile, extra_profiles):
+            master_path = os.path.join(output_dir, f"{stem}.master.{MASTER_FORMAT}")
+            _synthesize(script_text, master_path, master_tts_model([profile, *extra_profiles]), voice_name, speed, MASTER_FORMAT)
+            _finalize_audio(master_path, audio_path, profile, extra_profiles)
         else:
-            # This part might not be reached if generate_audio raises an exception on failure
-            raise RuntimeError("Audio generation reported failure without exception.")
+            _synthesize(script_text, audio_path, profile.tts_model, voice_name, speed, profile.tts_format)
+
+        logging.info("Podcast audio generated successfully.")
+        return audio_path
     except Exception as e:
         logging.error(f"Error generating podcast audio: {e}")
         raise # Re-raise the exception
-